@@ -0,0 +1,200 @@
+import sys
+import os
+import glob
+import json
+import zlib
+import base64
+import time
+import shutil
+import difflib
+import argparse
+import platform
+import tempfile
+import subprocess
+import importlib.util
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def load_scheduler(path=os.path.join(ROOT, 'scheduler-gpt.py')):
+    #scheduler-gpt.py is not an importable module name, so load it from its path
+    spec = importlib.util.spec_from_file_location('scheduler_gpt', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def golden_pairs(directory):
+    #Every .in file with its expected .out and .html
+    for input_file in sorted(glob.glob(os.path.join(directory, '*.in'))):
+        base = input_file[:-len('.in')]
+        yield input_file, base + '_test.out', base + '.html'
+
+def check_golden(scheduler, directory, work_dir):
+    #Simulates each golden input in work_dir and diffs the result against the expected files
+    results = []
+    for input_file, expected_out, expected_html in golden_pairs(directory):
+        name = os.path.basename(input_file)
+        copy = os.path.join(work_dir, name)
+        shutil.copyfile(input_file, copy)
+        start = time.perf_counter()
+        scheduler.simulate_file(copy)
+        elapsed = time.perf_counter() - start
+
+        mismatches = []
+        for expected, actual in ((expected_out, copy.replace('.in', '.out')), (expected_html, copy.replace('.in', '.html'))):
+            if not os.path.exists(expected):
+                continue
+            with open(expected) as file:
+                expected_lines = file.readlines()
+            with open(actual) as file:
+                actual_lines = file.readlines()
+            if expected_lines != actual_lines:
+                diff = difflib.unified_diff(expected_lines, actual_lines, os.path.basename(expected), os.path.basename(actual))
+                mismatches.append(''.join(diff))
+        results.append({'file': name, 'seconds': elapsed, 'ok': not mismatches, 'diff': mismatches})
+    return results
+
+def report_data(report_file):
+    #The JSON embedded in a .report.html: base64 lines of one raw deflate stream
+    with open(report_file) as file:
+        page = file.read()
+    start = page.index('<script id="data" type="application/octet-stream">\n')
+    lines = page[start:page.index('</script>', start)].splitlines()[1:]
+    return json.loads(zlib.decompress(b''.join(base64.b64decode(line) for line in lines), -15))
+
+def gantt_busy(data):
+    #Busy time per CPU as the report's Gantt chart draws it: a bar runs from a selection to the next selection,
+    #finish or release (kind 4) on the same CPU
+    meta = data['meta']
+    cpus = max(1, meta['cpus'])
+    stride = 5 if meta['cpus'] > 1 else 4
+    events = data['events']
+    busy = [0] * cpus
+    running = [None] * cpus
+    time = 0
+    for index in range(0, len(events), stride):
+        time += events[index]
+        kind = events[index + 1]
+        if kind not in (1, 2, 4):
+            continue
+        cpu = max(0, events[index + 4]) if stride == 5 else 0
+        if running[cpu] is not None:
+            busy[cpu] += time - running[cpu]
+        running[cpu] = time if kind == 1 else None
+    for cpu in range(cpus):
+        if running[cpu] is not None:
+            busy[cpu] += meta['run_for'] - running[cpu]
+    return busy
+
+def check_reports(scheduler, directory, work_dir):
+    #Writes the report for each N-CPU golden input and checks its Gantt bars against the CPU busy times
+    results = []
+    for input_file, _, _ in golden_pairs(directory):
+        options = scheduler.load_workload(input_file)[5]
+        if options.get('cpus', 1) < 2:
+            continue
+        name = os.path.basename(input_file)
+        copy = os.path.join(work_dir, name)
+        shutil.copyfile(input_file, copy)
+        scheduler.simulate_file(copy, formats=('report',))
+        data = report_data(copy.replace('.in', '.report.html'))
+        results.append({'file': name, 'ok': gantt_busy(data) == data['meta']['cpu_busy']})
+    return results
+
+def scaled_processes(scheduler, processes, run_for, count):
+    #Repeats the workload back to back, one copy every run_for ticks, until it has count processes
+    scaled = []
+    copy = 0
+    while len(scaled) < count:
+        offset = copy * run_for
+        for process in processes:
+            if len(scaled) == count:
+                break
+            scaled.append(scheduler.Process(f'{process.name}_{copy}', process.arrival + offset, process.burst, process.priority))
+        copy += 1
+    return scaled, run_for * copy
+
+def time_scaled(scheduler, directory, sizes, work_dir):
+    results = []
+    for input_file, _, _ in golden_pairs(directory):
+        process_count, run_for, algorithm, quantum, processes, options = scheduler.parse_input(input_file)
+        if not processes:
+            continue
+        for size in sizes:
+            scaled, scaled_run_for = scaled_processes(scheduler, processes, run_for, size)
+            schedule = scheduler.ArrivalSchedule(scaled)
+            output = os.path.join(work_dir, f'scaled-{size}.in')
+            cpus = options.get('cpus', 1)
+            shared = options.get('queues', 'shared') == 'shared'
+            policies = scheduler.make_policies(algorithm, quantum, cpus, shared, options)
+
+            start = time.perf_counter()
+            writer = scheduler.OutputWriter(output, schedule.process_count(), policies[0].title, policies[0].quantum, cpus=cpus, shared=shared)
+            metrics = scheduler.run_policies(schedule, scaled_run_for, policies, shared, writer)
+            writer.close(scaled_run_for, metrics, policies[0].report(policies))
+            elapsed = time.perf_counter() - start
+
+            results.append({
+                'workload': os.path.basename(input_file),
+                'algorithm': algorithm,
+                'processes': size,
+                'run_for': scaled_run_for,
+                'seconds': elapsed,
+                'processes_per_second': size / elapsed if elapsed > 0 else None,
+            })
+            print(f"{os.path.basename(input_file):<14} {algorithm:<5} {size:>9} processes  runfor {scaled_run_for:>10}  {elapsed:>9.3f}s")
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_with_previous(previous, scaled):
+    #Prints the speed of this run relative to the last recorded one for the same workload and size
+    before = {(r['workload'], r['processes']): r['seconds'] for r in previous.get('scaled', [])}
+    for result in scaled:
+        key = (result['workload'], result['processes'])
+        if key in before and result['seconds'] > 0:
+            ratio = before[key] / result['seconds']
+            print(f"{key[0]:<14} {key[1]:>9} processes  {before[key]:>9.3f}s -> {result['seconds']:>9.3f}s  ({ratio:.2f}x)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check scheduler-gpt.py against the golden outputs and time it on scaled workloads')
+    parser.add_argument('--golden-dir', default=os.path.join(ROOT, 'output-results'), help='directory of .in files with expected _test.out and .html files')
+    parser.add_argument('--sizes', type=int, nargs='*', default=[100, 10000, 1000000], help='process counts for the scaled workloads')
+    parser.add_argument('--results', default=os.path.join(ROOT, 'benchmark-results.json'), help='machine-readable results file')
+    args = parser.parse_args()
+
+    scheduler = load_scheduler()
+    previous = None
+    if os.path.exists(args.results):
+        with open(args.results) as file:
+            previous = json.load(file)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        golden = check_golden(scheduler, args.golden_dir, work_dir)
+        for result in golden:
+            print(f"{result['file']:<14} {'ok' if result['ok'] else 'MISMATCH'}")
+            for diff in result['diff']:
+                print(diff)
+        reports = check_reports(scheduler, args.golden_dir, work_dir)
+        for result in reports:
+            print(f"{result['file']:<14} report {'ok' if result['ok'] else 'MISMATCH'}")
+        scaled = time_scaled(scheduler, args.golden_dir, args.sizes, work_dir)
+
+    if previous:
+        print(f"\nCompared with {previous.get('commit') or 'previous run'}:")
+        compare_with_previous(previous, scaled)
+
+    with open(args.results, 'w') as file:
+        json.dump({
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'golden': [{key: result[key] for key in ('file', 'seconds', 'ok')} for result in golden],
+            'reports': reports,
+            'scaled': scaled,
+        }, file, indent=2)
+
+    sys.exit(0 if all(result['ok'] for result in golden + reports) else 1)
@@ -0,0 +1,104 @@
+import sys
+import math
+import random
+import argparse
+
+#Lines are written in blocks of this many processes so huge workloads never sit in memory
+CHUNK_SIZE = 65536
+
+def arrival_times(rng, count, pattern, rate, group_size):
+    #Yields count non-decreasing arrival times
+    time = 0.0
+    if pattern == 'poisson':
+        #Exponential gaps between single arrivals
+        for _ in range(count):
+            yield int(time)
+            time += rng.expovariate(rate)
+    elif pattern == 'bursty':
+        #Groups of up to group_size processes arrive together, groups themselves are Poisson
+        produced = 0
+        while produced < count:
+            size = min(rng.randint(1, 2 * group_size - 1), count - produced)
+            for _ in range(size):
+                yield int(time)
+            produced += size
+            time += rng.expovariate(rate / group_size)
+    else:
+        #Evenly spaced arrivals
+        for index in range(count):
+            yield int(index / rate)
+
+def burst_times(rng, count, distribution, mean, alpha):
+    #Yields count burst lengths of at least 1
+    if distribution == 'pareto':
+        #Heavy tail: scale chosen so the distribution mean is the requested mean
+        scale = mean * (alpha - 1) / alpha
+        for _ in range(count):
+            yield max(1, round(scale * rng.paretovariate(alpha)))
+    elif distribution == 'exponential':
+        for _ in range(count):
+            yield max(1, round(rng.expovariate(1 / mean)))
+    else:
+        for _ in range(count):
+            yield rng.randint(1, max(1, 2 * round(mean) - 1))
+
+def priority_levels(rng, count, levels):
+    #Yields count priorities spread evenly over 0..levels-1, or nothing to write when levels is 0
+    for _ in range(count):
+        yield rng.randrange(levels) if levels else None
+
+def write_workload(file, count, run_for, use, quantum, arrivals, bursts, priorities):
+    file.write(f"processcount {count}\n")
+    file.write(f"runfor {run_for}\n")
+    file.write(f"use {use}\n")
+    if quantum is not None:
+        file.write(f"quantum {quantum}\n")
+    lines = []
+    for index, (arrival, burst, priority) in enumerate(zip(arrivals, bursts, priorities), 1):
+        if priority is None:
+            lines.append(f"process name P{index} arrival {arrival} burst {burst}\n")
+        else:
+            lines.append(f"process name P{index} arrival {arrival} burst {burst} priority {priority}\n")
+        if len(lines) == CHUNK_SIZE:
+            file.writelines(lines)
+            lines = []
+    file.writelines(lines)
+    file.write("end\n")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Write a synthetic .in workload for scheduler-gpt.py')
+    parser.add_argument('output', help='.in file to write, or - for stdout')
+    parser.add_argument('--processes', type=int, default=1000, help='number of processes')
+    parser.add_argument('--runfor', type=int, help='run length (default: long enough to finish every process on average)')
+    parser.add_argument('--use', choices=['fcfs', 'sjf', 'rr', 'priority'], default='rr', help='scheduling algorithm')
+    parser.add_argument('--quantum', type=int, default=2, help='quantum, written only for rr')
+    parser.add_argument('--arrivals', choices=['poisson', 'bursty', 'uniform'], default='poisson', help='arrival pattern')
+    parser.add_argument('--rate', type=float, default=0.2, help='mean arrivals per time unit')
+    parser.add_argument('--group-size', type=int, default=8, help='mean processes per group for bursty arrivals')
+    parser.add_argument('--bursts', choices=['exponential', 'pareto', 'uniform'], default='exponential', help='burst length distribution')
+    parser.add_argument('--mean-burst', type=float, default=5.0, help='mean burst length')
+    parser.add_argument('--alpha', type=float, default=1.5, help='Pareto shape for heavy-tailed bursts, must be above 1')
+    parser.add_argument('--priorities', type=int, default=0, help='number of priority levels to draw from (0 writes no priorities)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed, the same seed always gives the same file')
+    args = parser.parse_args()
+
+    if args.processes < 0 or args.rate <= 0 or args.mean_burst < 1 or args.group_size < 1 or args.priorities < 0:
+        parser.error('--processes must be >= 0, --rate > 0, --mean-burst >= 1 and --group-size >= 1 and --priorities >= 0')
+    if args.bursts == 'pareto' and args.alpha <= 1:
+        parser.error('--alpha must be above 1')
+
+    run_for = args.runfor
+    if run_for is None:
+        run_for = math.ceil(args.processes / args.rate + args.processes * args.mean_burst) + 1
+    quantum = args.quantum if args.use == 'rr' else None
+
+    #Separate streams keep the arrivals identical when only the burst options change
+    arrivals = arrival_times(random.Random(f'{args.seed}-arrivals'), args.processes, args.arrivals, args.rate, args.group_size)
+    bursts = burst_times(random.Random(f'{args.seed}-bursts'), args.processes, args.bursts, args.mean_burst, args.alpha)
+    priorities = priority_levels(random.Random(f'{args.seed}-priorities'), args.processes, args.priorities)
+
+    if args.output == '-':
+        write_workload(sys.stdout, args.processes, run_for, args.use, quantum, arrivals, bursts, priorities)
+    else:
+        with open(args.output, 'w', buffering=1 << 20) as file:
+            write_workload(file, args.processes, run_for, args.use, quantum, arrivals, bursts, priorities)
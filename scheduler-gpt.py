@@ -1,277 +1,2430 @@
 import sys
+import os
+import glob
+import mmap
+import struct
+import time
+import argparse
+import heapq
+import socket
+import asyncio
+import secrets
+import urllib.parse
+import io
+import csv
+import json
+import html
+import base64
+import zlib
+import pickle
+import shutil
+import hashlib
+import multiprocessing
+from array import array
+from http import HTTPStatus
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+#Input files at least this large are memory-mapped by parse_input
+MMAP_THRESHOLD = 1 << 20
+
+#Binary workload format: magic, version, process count, runfor, quantum (-1 if none), use, options length
+BINARY_MAGIC = b'GPTW'
+BINARY_VERSION = 2
+BINARY_HEADER = struct.Struct('<4sIQqq8sQ')
+BINARY_EXTENSION = '.inb'
+#Options that always hold a list of values
+LIST_OPTIONS = {'quantums'}
+
+#Checkpoints are written next to the output; the clock is only read every CHECKPOINT_CHECK_EVERY events
+CHECKPOINT_VERSION = 1
+CHECKPOINT_EXTENSION = '.ckpt'
+CHECKPOINT_CHECK_EVERY = 4096
+#The only library globals a checkpoint refers to, besides this file's policy and queue classes
+CHECKPOINT_GLOBALS = {('array', 'array'), ('array', '_array_reconstructor'), ('collections', 'deque')}
+
+#--cache: entries are evicted least recently used first once the cache grows past its size limit
+CACHE_FORMAT_VERSION = 1
+CACHE_DEFAULT_SIZE = 1 << 30
+CACHE_STATS = 'stats.json'
+
+#NumPy is optional, metrics fall back to plain Python lists without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 class Process:
-    def __init__(self, name, arrival, burst):
+    #Slots keep each process record small for traces with millions of processes
+    __slots__ = ('name', 'arrival', 'burst', 'priority', 'remaining', 'start_time', 'end_time')
+
+    def __init__(self, name, arrival, burst, priority=0):
         self.name = name
         self.arrival = arrival
         self.burst = burst
-        self.remaining_burst = burst
+        #Lower values run first; only the priority policy looks at it
+        self.priority = priority
+        self.remaining = burst
         self.start_time = None
         self.end_time = None
-        self.original_burst = burst
 
-def parse_input(file_name):
-    with open(file_name, 'r') as file:
-        lines = file.readlines()
+class ArrivalSchedule:
+    #Built once after parsing: arrival time -> processes arriving then, in input order
+    def __init__(self, processes):
+        self.processes = sorted(processes, key=lambda p: p.arrival)
+        self.buckets = {}
+        for process in self.processes:
+            #Processes arriving before time 0 are never seen by the scheduler
+            if process.arrival >= 0:
+                self.buckets.setdefault(process.arrival, []).append(process)
+        self.times = sorted(self.buckets)
+        self.cursor = 0
 
-    process_count = int(lines[0].split()[1])
-    run_for = int(lines[1].split()[1])
-    algorithm = lines[2].split()[1]
-    
-    quantum = None
-    if algorithm == 'rr':
-        quantum = int(lines[3].split()[1])
-        process_lines = lines[4:-1]
-    else:
-        process_lines = lines[3:-1]
+    def process_count(self):
+        #Processes are reported by name, so a repeated name counts once
+        return len({process.name for process in self.processes})
+
+    def reset(self):
+        #Rewind the cursor and clear per-process state so the schedule can be simulated again
+        self.cursor = 0
+        for process in self.processes:
+            process.remaining = process.burst
+            process.start_time = None
+            process.end_time = None
+
+    def next_arrival(self):
+        if self.cursor < len(self.times):
+            return self.times[self.cursor]
+        return None
+
+    def pop_arrivals(self, current_time):
+        if self.cursor < len(self.times) and self.times[self.cursor] == current_time:
+            self.cursor += 1
+            return self.buckets[current_time]
+        return []
+
+class RunQueue:
+    #FIFO run queue shared by fcfs and rr, O(1) push and pop
+    def __init__(self):
+        self.queue = deque()
+
+    def __len__(self):
+        return len(self.queue)
+
+    def push(self, process):
+        self.queue.append(process)
+
+    def pop(self):
+        return self.queue.popleft()
+
+    def peek(self):
+        return self.queue[0]
+
+class ShortestBurstQueue(RunQueue):
+    #Heap of (remaining burst, order, process); order keeps ties in the order they were queued
+    def __init__(self):
+        self.queue = []
+        self.order = 0
 
+    def push(self, process):
+        self.order += 1
+        heapq.heappush(self.queue, (process.remaining, self.order, process))
+
+    def pop(self):
+        return heapq.heappop(self.queue)[2]
+
+    def peek(self):
+        return self.queue[0][2]
+
+class IndexedHeap(RunQueue):
+    #Binary heap of [key, order, process] that tracks each process's slot, so its key can be lowered in place
+    def __init__(self):
+        self.queue = []
+        self.position = {}
+        self.order = 0
+
+    def __contains__(self, process):
+        return process in self.position
+
+    def push(self, process, key=None):
+        #Returns the entry's order, which identifies this stay in the heap
+        self.order += 1
+        entry = [process.priority if key is None else key, self.order, process]
+        self.queue.append(entry)
+        self.position[process] = len(self.queue) - 1
+        self.sift_up(len(self.queue) - 1)
+        return entry[1]
+
+    def pop(self):
+        last = self.queue.pop()
+        if not self.queue:
+            del self.position[last[2]]
+            return last[2]
+        top = self.queue[0]
+        self.queue[0] = last
+        self.position[last[2]] = 0
+        del self.position[top[2]]
+        self.sift_down(0)
+        return top[2]
+
+    def peek(self):
+        return self.queue[0][2]
+
+    def peek_key(self):
+        return self.queue[0][0]
+
+    def key_of(self, process):
+        return self.queue[self.position[process]][0]
+
+    def order_of(self, process):
+        return self.queue[self.position[process]][1]
+
+    def decrease_key(self, process, key):
+        index = self.position[process]
+        self.queue[index][0] = key
+        self.sift_up(index)
+
+    def sift_up(self, index):
+        entry = self.queue[index]
+        while index > 0:
+            parent = (index - 1) // 2
+            if self.queue[parent][:2] <= entry[:2]:
+                break
+            self.queue[index] = self.queue[parent]
+            self.position[self.queue[index][2]] = index
+            index = parent
+        self.queue[index] = entry
+        self.position[entry[2]] = index
+
+    def sift_down(self, index):
+        entry = self.queue[index]
+        size = len(self.queue)
+        while True:
+            child = 2 * index + 1
+            if child >= size:
+                break
+            if child + 1 < size and self.queue[child + 1][:2] < self.queue[child][:2]:
+                child += 1
+            if entry[:2] <= self.queue[child][:2]:
+                break
+            self.queue[index] = self.queue[child]
+            self.position[self.queue[index][2]] = index
+            index = child
+        self.queue[index] = entry
+        self.position[entry[2]] = index
+
+def parse_fields(parts, line_number):
+    #Turns 'name P1 arrival 0 burst 5' into a dict, keys may come in any order
+    if len(parts) % 2:
+        raise ValueError(f"Line {line_number}: expected key/value pairs after 'process'")
+    return {parts[i].decode(): parts[i + 1] for i in range(0, len(parts), 2)}
+
+def parse_workload(source):
+    #Reads a text workload one line at a time from anything with readline(); directives may come in any order
+    #and '#' starts a comment
+    process_count = None
+    run_for = None
+    algorithm = None
+    quantum = None
     processes = []
-    for line in process_lines:
-        parts = line.split()
-        name = parts[2]
-        arrival = int(parts[4])
-        burst = int(parts[6])
-        processes.append(Process(name, arrival, burst))
+    #Optional directives: cpus N, queues shared|percpu, for mlfq levels N, quantums Q1 Q2 ..., boost N,
+    #and for priority aging N
+    options = {}
 
-    return process_count, run_for, algorithm, quantum, processes
+    for line_number, line in enumerate(iter(source.readline, b''), 1):
+        parts = line.split(b'#', 1)[0].split()
+        if not parts:
+            continue
+        directive = parts[0]
+        try:
+            if directive == b'process':
+                fields = parse_fields(parts[1:], line_number)
+                processes.append(Process(fields['name'].decode(), int(fields['arrival']), int(fields['burst']), int(fields.get('priority', 0))))
+            elif directive == b'processcount':
+                process_count = int(parts[1])
+            elif directive == b'runfor':
+                run_for = int(parts[1])
+            elif directive == b'use':
+                algorithm = parts[1].decode()
+            elif directive == b'quantum':
+                quantum = int(parts[1])
+            elif directive == b'cpus':
+                options['cpus'] = int(parts[1])
+            elif directive == b'queues':
+                options['queues'] = parts[1].decode()
+            elif directive == b'levels':
+                options['levels'] = int(parts[1])
+            elif directive == b'quantums':
+                options['quantums'] = [int(part) for part in parts[1:]]
+            elif directive == b'boost':
+                options['boost'] = int(parts[1])
+            elif directive == b'aging':
+                options['aging'] = int(parts[1])
+            elif directive == b'end':
+                break
+            else:
+                raise ValueError(f"Line {line_number}: unknown directive '{directive.decode()}'")
+        except (IndexError, KeyError) as exc:
+            raise ValueError(f"Line {line_number}: missing value for '{directive.decode()}'") from exc
 
-def calculate_metrics(processes):
-    metrics = {}
-    for process in processes:
-        turnaround_time = process.end_time - process.arrival if process.end_time is not None else 0
-        wait_time = turnaround_time- process.original_burst if process.start_time is not None else 0
-        response_time = process.start_time - process.arrival if process.start_time is not None else 0
-        metrics[process.name] = {
-            'wait': wait_time,
-            'turnaround': turnaround_time,
-            'response': response_time
+    if run_for is None:
+        raise ValueError("Missing parameter 'runfor'")
+    if algorithm is None:
+        raise ValueError("Missing parameter 'use'")
+    if process_count is not None and process_count != len(processes):
+        raise ValueError(f"processcount is {process_count} but {len(processes)} processes were listed")
+    if options.get('cpus', 1) < 1:
+        raise ValueError("cpus must be at least 1")
+    if options.get('queues', 'shared') not in ('shared', 'percpu'):
+        raise ValueError(f"Unknown queues '{options['queues']}', expected shared or percpu")
+
+    return process_count, run_for, algorithm, quantum, processes, options
+
+def parse_input(file_name):
+    with open(file_name, 'rb') as file:
+        #Large files are memory-mapped so the OS pages them in instead of copying through a read buffer
+        if os.fstat(file.fileno()).st_size < MMAP_THRESHOLD:
+            return parse_workload(file)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as source:
+            return parse_workload(source)
+
+def write_binary_workload(file_name, run_for, algorithm, quantum, processes, options):
+    #Header, then arrival, burst and priority as packed int64 columns, name offsets, the UTF-8 name table and the options text
+    options_text = ''.join(f"{key} {' '.join(map(str, value)) if isinstance(value, list) else value}\n" for key, value in options.items()).encode()
+    names = [process.name.encode() for process in processes]
+    offsets = array('Q', [0])
+    for name in names:
+        offsets.append(offsets[-1] + len(name))
+    arrivals = array('q', (process.arrival for process in processes))
+    bursts = array('q', (process.burst for process in processes))
+    priorities = array('q', (process.priority for process in processes))
+    if sys.byteorder != 'little':
+        for column in (offsets, arrivals, bursts, priorities):
+            column.byteswap()
+    with open(file_name, 'wb') as file:
+        file.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(processes), run_for,
+                                      -1 if quantum is None else quantum, algorithm.encode(), len(options_text)))
+        arrivals.tofile(file)
+        bursts.tofile(file)
+        priorities.tofile(file)
+        offsets.tofile(file)
+        file.write(b''.join(names))
+        file.write(options_text)
+
+def load_binary_workload(file_name):
+    #Memory-maps a workload written by write_binary_workload and reads the columns in place
+    with open(file_name, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if len(mapped) < BINARY_HEADER.size:
+            raise ValueError(f"'{file_name}' is not a version 1-{BINARY_VERSION} binary workload")
+        magic, version, count, run_for, quantum, algorithm, options_length = BINARY_HEADER.unpack_from(mapped)
+        if magic != BINARY_MAGIC or not 1 <= version <= BINARY_VERSION:
+            raise ValueError(f"'{file_name}' is not a version 1-{BINARY_VERSION} binary workload")
+        #Version 1 files have no priority column
+        typecodes = ('q', 'q', 'q', 'Q') if version >= 2 else ('q', 'q', 'Q')
+        start = BINARY_HEADER.size
+        if len(mapped) < start + 8 * (count * len(typecodes) + 1) + options_length:
+            raise ValueError(f"'{file_name}' is truncated: its header lists {count} processes")
+        view = memoryview(mapped)
+        columns = []
+        name_table = None
+        #Views into the map must be released before it can be closed, also when the file turns out to be corrupt
+        try:
+            for typecode in typecodes:
+                length = count + 1 if typecode == 'Q' else count
+                column = view[start:start + 8 * length].cast(typecode)
+                if sys.byteorder != 'little':
+                    column = array(typecode, column.tobytes())
+                    column.byteswap()
+                columns.append(column)
+                start += 8 * length
+            arrivals, bursts = columns[0], columns[1]
+            priorities = columns[2] if version >= 2 else [0] * count
+            offsets = columns[-1]
+            if offsets[0] != 0 or start + offsets[count] + options_length != len(mapped):
+                raise ValueError(f"'{file_name}' is corrupt: its name table does not match the file size")
+            name_table = view[start:start + offsets[count]]
+            processes = [Process(str(name_table[offsets[i]:offsets[i + 1]], 'utf-8'), arrivals[i], bursts[i], priorities[i]) for i in range(count)]
+            options = {}
+            for line in mapped[start + offsets[count]:start + offsets[count] + options_length].decode().splitlines():
+                key, *values = line.split()
+                values = [int(value) if value.lstrip('-').isdigit() else value for value in values]
+                options[key] = values if key in LIST_OPTIONS else values[0]
+        finally:
+            for column in columns:
+                if isinstance(column, memoryview):
+                    column.release()
+            if name_table is not None:
+                name_table.release()
+            view.release()
+    return count, run_for, algorithm.rstrip(b'\0').decode(), None if quantum < 0 else quantum, processes, options
+
+def load_workload(file_name):
+    #Binary workloads are recognised by their magic bytes, anything else is parsed as text
+    with open(file_name, 'rb') as file:
+        magic = file.read(len(BINARY_MAGIC))
+    if magic == BINARY_MAGIC:
+        return load_binary_workload(file_name)
+    return parse_input(file_name)
+
+def output_path(file_name, extension):
+    #Text workloads keep the original naming; binary workloads swap their own extension
+    root, ext = os.path.splitext(file_name)
+    if ext == BINARY_EXTENSION:
+        return root + extension
+    return file_name.replace('.in', extension)
+
+def percentile(sorted_values, percent):
+    #Linear interpolation between closest ranks, same as numpy.percentile
+    if not sorted_values:
+        return 0
+    position = (len(sorted_values) - 1) * percent / 100
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+class Metrics:
+    #Wait, turnaround and response for every process, stored as columns
+    def __init__(self, names, wait, turnaround, response, finished, busy_time):
+        self.names = names
+        self.wait = wait
+        self.turnaround = turnaround
+        self.response = response
+        self.finished = finished
+        self.busy_time = busy_time
+        #Busy time per CPU, filled in by simulate_smp
+        self.cpu_busy = [busy_time]
+
+    def rows(self):
+        #One row per name sorted by name; a later process with the same name replaces an earlier one
+        latest = {name: index for index, name in enumerate(self.names)}
+        for name in sorted(latest):
+            index = latest[name]
+            yield name, int(self.wait[index]), int(self.turnaround[index]), int(self.response[index])
+
+    def to_dict(self):
+        #Everything needed to rebuild the metrics, as plain JSON values
+        return {'names': self.names, 'wait': [int(value) for value in self.wait], 'turnaround': [int(value) for value in self.turnaround],
+                'response': [int(value) for value in self.response], 'finished': [bool(value) for value in self.finished],
+                'busy_time': int(self.busy_time), 'cpu_busy': [int(busy) for busy in self.cpu_busy]}
+
+    @classmethod
+    def from_dict(cls, data):
+        wait, turnaround, response, finished = data['wait'], data['turnaround'], data['response'], data['finished']
+        if numpy is not None:
+            wait, turnaround, response = (numpy.array(column, dtype=numpy.int64) for column in (wait, turnaround, response))
+            finished = numpy.array(finished, dtype=bool)
+        metrics = cls(data['names'], wait, turnaround, response, finished, data['busy_time'])
+        metrics.cpu_busy = data['cpu_busy']
+        return metrics
+
+    def columns(self):
+        #The rows() table as one list per column, plus whether each process finished
+        latest = {name: index for index, name in enumerate(self.names)}
+        names = sorted(latest)
+        columns = {'name': names}
+        for key in ('wait', 'turnaround', 'response'):
+            column = getattr(self, key)
+            columns[key] = [int(column[latest[name]]) for name in names]
+        columns['finished'] = [bool(self.finished[latest[name]]) for name in names]
+        return columns
+
+    def summary(self, run_for):
+        #Aggregates over the processes that finished within run_for
+        summary = {
+            'completed': int(sum(self.finished)),
+            'throughput': int(sum(self.finished)) / run_for if run_for > 0 else 0,
+            'cpu_utilization': self.busy_time / (run_for * len(self.cpu_busy)) if run_for > 0 else 0,
         }
-    return metrics
+        if len(self.cpu_busy) > 1:
+            summary['cpu_busy'] = [int(busy) for busy in self.cpu_busy]
+        for key in ('wait', 'turnaround', 'response'):
+            column = getattr(self, key)
+            if numpy is not None and numpy.count_nonzero(self.finished):
+                values = column[self.finished]
+                p50, p95, p99 = numpy.percentile(values, [50, 95, 99])
+                summary[key] = {'mean': float(values.mean()), 'p50': float(p50), 'p95': float(p95),
+                                'p99': float(p99), 'max': int(values.max())}
+            else:
+                values = sorted(int(value) for value, done in zip(column, self.finished) if done)
+                summary[key] = {
+                    'mean': sum(values) / len(values) if values else 0,
+                    'p50': percentile(values, 50),
+                    'p95': percentile(values, 95),
+                    'p99': percentile(values, 99),
+                    'max': values[-1] if values else 0,
+                }
+        return summary
 
-def fcfs(processes, run_for):
-    processes.sort(key=lambda p: p.arrival)
-    current_time = 0
-    log = []
-    queue = []
-    running_process = None
-    temp_burst = 0
+def calculate_metrics(processes):
+    #Computes every process at once from column arrays; None times are stored as -1
+    names = [process.name for process in processes]
+    if numpy is not None:
+        count = len(processes)
+        arrival = numpy.fromiter((p.arrival for p in processes), dtype=numpy.int64, count=count)
+        burst = numpy.fromiter((p.burst for p in processes), dtype=numpy.int64, count=count)
+        remaining = numpy.fromiter((p.remaining for p in processes), dtype=numpy.int64, count=count)
+        start = numpy.fromiter((-1 if p.start_time is None else p.start_time for p in processes), dtype=numpy.int64, count=count)
+        end = numpy.fromiter((-1 if p.end_time is None else p.end_time for p in processes), dtype=numpy.int64, count=count)
+        started = start >= 0
+        finished = end >= 0
+        turnaround = numpy.where(finished, end - arrival, 0)
+        wait = numpy.where(started, turnaround - burst, 0)
+        response = numpy.where(started, start - arrival, 0)
+        busy_time = int((burst - remaining).sum())
+    else:
+        finished = [p.end_time is not None for p in processes]
+        turnaround = [p.end_time - p.arrival if p.end_time is not None else 0 for p in processes]
+        wait = [t - p.burst if p.start_time is not None else 0 for t, p in zip(turnaround, processes)]
+        response = [p.start_time - p.arrival if p.start_time is not None else 0 for p in processes]
+        busy_time = sum(p.burst - p.remaining for p in processes)
+    return Metrics(names, wait, turnaround, response, finished, busy_time)
+
+#Scheduling policies by the name used in the 'use' directive
+POLICIES = {}
+
+def register_policy(policy_class):
+    POLICIES[policy_class.name] = policy_class
+    return policy_class
+
+class Policy:
+    #Decides which ready process runs; simulate() does all arrival, completion and idle bookkeeping
+    name = None
+    title = None
+    needs_quantum = False
+    quantum = None
+    #Whether a process first dispatched by a preemption gets its start_time recorded
+    preemption_sets_start_time = True
+
+    def __init__(self, quantum=None, options=None):
+        self.queue = RunQueue()
+
+    def on_arrival(self, process, current_time):
+        self.queue.push(process)
+
+    def pick_next(self, current_time):
+        if self.queue:
+            return self.queue.pop()
+        return None
+
+    def on_dispatch(self, process, current_time):
+        pass
+
+    def should_preempt(self, running_process, current_time):
+        return False
+
+    def on_preempt(self, process, current_time):
+        self.queue.push(process)
+
+    def steal_from(self, other, current_time):
+        #Per-CPU queues only: takes the next process from another CPU's queue when this one's is empty
+        return other.pick_next(current_time)
+
+    def on_run(self, process, elapsed):
+        pass
+
+    def next_decision(self, running_process, current_time):
+        #Earliest time after current_time at which should_preempt may change its answer without an arrival
+        return None
+
+    def preemption_rank(self, process, current_time):
+        #Shared queues only: the running process with the highest rank is the first one considered for preemption
+        return current_time + process.remaining
+
+    @classmethod
+    def report(cls, policies):
+        #Extra (label, [(column, value), ...]) rows for the end of the output, combined over every CPU's policy
+        return []
+
+@register_policy
+class FirstComeFirstServed(Policy):
+    name = 'fcfs'
+    title = 'First-Come First-Served'
+
+@register_policy
+class ShortestJobFirst(Policy):
+    name = 'sjf'
+    title = 'preemptive Shortest Job First'
+    #Kept from the original sjf loop, which only set start_time on a normal selection
+    preemption_sets_start_time = False
+
+    def __init__(self, quantum=None, options=None):
+        self.queue = ShortestBurstQueue()
+
+    def should_preempt(self, running_process, current_time):
+        #Queued bursts never change and the running one only shrinks, so this can only become true on an arrival
+        return bool(self.queue) and self.queue.peek().remaining < running_process.remaining
+
+@register_policy
+class RoundRobin(Policy):
+    name = 'rr'
+    title = 'Round-Robin'
+    needs_quantum = True
+
+    def __init__(self, quantum=None, options=None):
+        super().__init__(quantum, options)
+        self.quantum = quantum
+        #Length of the current slice; subclasses may give each dispatch a different one
+        self.slice_quantum = quantum
+        self.time_slice = 0
+
+    def on_dispatch(self, process, current_time):
+        self.time_slice = 0
+
+    def should_preempt(self, running_process, current_time):
+        return self.time_slice == self.slice_quantum
+
+    def on_run(self, process, elapsed):
+        self.time_slice += elapsed
+
+    def next_decision(self, running_process, current_time):
+        if self.slice_quantum > self.time_slice:
+            return current_time + self.slice_quantum - self.time_slice
+        return None
+
+class MultiLevelQueue(RunQueue):
+    #One FIFO per priority level (0 is highest) plus the level of every process it has seen
+    def __init__(self, levels, boost):
+        self.levels = [deque() for _ in range(levels)]
+        self.count = 0
+        #Levels are stored with the boost epoch they were set in, so a boost resets them all in O(1)
+        self.level = {}
+        self.epoch = 0
+        self.boost = boost
+        self.next_boost = boost if boost > 0 else None
+
+    def __len__(self):
+        return self.count
+
+    def level_of(self, process):
+        entry = self.level.get(process)
+        if entry is None or entry[1] != self.epoch:
+            return 0
+        return entry[0]
+
+    def set_level(self, process, level):
+        self.level[process] = (level, self.epoch)
+
+    def push(self, process):
+        self.levels[self.level_of(process)].append(process)
+        self.count += 1
+
+    def top_level(self):
+        for level, queue in enumerate(self.levels):
+            if queue:
+                return level
+        return None
+
+    def pop(self):
+        self.count -= 1
+        return self.levels[self.top_level()].popleft()
+
+    def peek(self):
+        return self.levels[self.top_level()][0]
+
+    def boost_if_due(self, current_time):
+        #Moves every process back to the top level once per boost period
+        if self.next_boost is None or current_time < self.next_boost:
+            return
+        self.epoch += 1
+        for queue in self.levels[1:]:
+            self.levels[0].extend(queue)
+            queue.clear()
+        self.next_boost = (current_time // self.boost + 1) * self.boost
+
+@register_policy
+class MultilevelFeedbackQueue(RoundRobin):
+    #Round-robin within each level; a process that uses its whole quantum drops a level
+    name = 'mlfq'
+    needs_quantum = False
+
+    def __init__(self, quantum=None, options=None):
+        options = options or {}
+        levels = options.get('levels', 3)
+        quantums = options.get('quantums') or [(quantum or 2) * 2 ** level for level in range(levels)]
+        boost = options.get('boost', 0)
+        if levels < 1 or len(quantums) != levels or min(quantums) < 1:
+            raise ValueError(f"mlfq needs one positive quantum per level, got {levels} levels and quantums {quantums}")
+        super().__init__(None, options)
+        self.queue = MultiLevelQueue(levels, boost)
+        self.quantums = quantums
+        self.running_level = 0
+        self.dispatches = [0] * levels
+        self.ticks = [0] * levels
+        self.title = f"Multilevel Feedback Queue ({levels} levels, quantums {' '.join(map(str, quantums))}"
+        self.title += f", boost every {boost})" if boost > 0 else ")"
+
+    def on_arrival(self, process, current_time):
+        self.queue.boost_if_due(current_time)
+        self.queue.push(process)
+
+    def pick_next(self, current_time):
+        self.queue.boost_if_due(current_time)
+        return super().pick_next(current_time)
+
+    def on_dispatch(self, process, current_time):
+        super().on_dispatch(process, current_time)
+        self.running_level = self.queue.level_of(process)
+        self.slice_quantum = self.quantums[self.running_level]
+        self.dispatches[self.running_level] += 1
+
+    def should_preempt(self, running_process, current_time):
+        #The quantum ran out, or a process is waiting on a higher level than the running one
+        self.queue.boost_if_due(current_time)
+        if super().should_preempt(running_process, current_time):
+            return True
+        top_level = self.queue.top_level()
+        return top_level is not None and top_level < self.queue.level_of(running_process)
+
+    def preemption_rank(self, process, current_time):
+        #With shared queues the CPU running the lowest level is the one a waiting higher level process preempts
+        return self.running_level
+
+    def on_preempt(self, process, current_time):
+        level = self.queue.level_of(process)
+        if self.time_slice >= self.slice_quantum:
+            level = min(level + 1, len(self.quantums) - 1)
+        self.queue.set_level(process, level)
+        self.queue.push(process)
+
+    def on_run(self, process, elapsed):
+        super().on_run(process, elapsed)
+        self.ticks[self.running_level] += elapsed
+
+    def next_decision(self, running_process, current_time):
+        decision_time = super().next_decision(running_process, current_time)
+        if self.queue.next_boost is not None and (decision_time is None or self.queue.next_boost < decision_time):
+            return self.queue.next_boost
+        return decision_time
+
+    @classmethod
+    def report(cls, policies):
+        #Dispatches and CPU time per level, summed over every CPU
+        total = sum(sum(policy.ticks) for policy in policies)
+        rows = []
+        for level, quantum in enumerate(policies[0].quantums):
+            ticks = sum(policy.ticks[level] for policy in policies)
+            residency = f"{ticks / total:.2%}" if total else "0.00%"
+            rows.append((f"Level {level:>2}", [('quantum', quantum), ('dispatches', sum(policy.dispatches[level] for policy in policies)),
+                                                ('ticks', ticks), ('residency', residency)]))
+        return rows
+
+@register_policy
+class PriorityScheduling(Policy):
+    #Preemptive priority (lower runs first); every aging ticks spent waiting improve a process's priority by one
+    name = 'priority'
+
+    def __init__(self, quantum=None, options=None):
+        options = options or {}
+        self.aging = options.get('aging', 10)
+        if self.aging < 0:
+            raise ValueError("aging must be 0 (off) or a positive number of ticks")
+        self.queue = IndexedHeap()
+        #Shared with every CPU's policy through the queue, like the queue itself
+        self.queue.aging_events = []
+        self.running_priority = 0
+        self.title = 'preemptive Priority' + (f' with aging every {self.aging}' if self.aging else '')
+
+    def enqueue(self, process, current_time):
+        #A process starts waiting at its own priority and schedules its first aging step
+        order = self.queue.push(process, process.priority)
+        if self.aging:
+            heapq.heappush(self.queue.aging_events, (current_time + self.aging, order, process))
+
+    def age(self, current_time):
+        #Applies every aging step that is due, each one a decrease-key
+        events = self.queue.aging_events
+        while events and events[0][0] <= current_time:
+            event_time, order, process = heapq.heappop(events)
+            #Skip steps for processes that have since been dispatched or queued again
+            if process not in self.queue or self.queue.order_of(process) != order:
+                continue
+            self.queue.decrease_key(process, self.queue.key_of(process) - 1)
+            heapq.heappush(events, (event_time + self.aging, order, process))
+
+    def on_arrival(self, process, current_time):
+        self.age(current_time)
+        self.enqueue(process, current_time)
+
+    def on_preempt(self, process, current_time):
+        self.enqueue(process, current_time)
+
+    def pick_next(self, current_time):
+        self.age(current_time)
+        if self.queue:
+            self.running_priority = self.queue.peek_key()
+            return self.queue.pop()
+        return None
+
+    def steal_from(self, other, current_time):
+        #The stolen process brings its aged priority here; the other CPU keeps the one it is running at
+        running_priority = other.running_priority
+        process = other.pick_next(current_time)
+        self.running_priority, other.running_priority = other.running_priority, running_priority
+        return process
+
+    def should_preempt(self, running_process, current_time):
+        #The running process keeps the priority it was dispatched with
+        self.age(current_time)
+        return bool(self.queue) and self.queue.peek_key() < self.running_priority
+
+    def preemption_rank(self, process, current_time):
+        return self.running_priority
+
+    def next_decision(self, running_process, current_time):
+        #The next aging step may let a waiting process overtake the running one
+        events = self.queue.aging_events
+        while events and events[0][2] not in self.queue:
+            heapq.heappop(events)
+        if events:
+            return max(events[0][0], current_time + 1)
+        return None
+
+def simulate(schedule, run_for, policy, log, checkpoint=None, resume=None):
+    #Jumps from event to event (arrival, completion, policy decision) instead of stepping one time unit at a time
+    if resume is None:
+        schedule.reset()
+        current_time = 0
+        running_process = None
+    else:
+        current_time, running_process = resume
 
     while current_time < run_for:
 
+        if checkpoint is not None and checkpoint.due():
+            checkpoint.save(schedule, [policy], log, (current_time, running_process))
+
         #Check for new arrivals
-        arrivals = [p for p in processes if p.arrival == current_time]
+        for process in schedule.pop_arrivals(current_time):
+            log.emit(current_time, 'arrived', process.name)
+            policy.on_arrival(process, current_time)
 
-        for process in arrivals:
-            log.append((current_time, f'{process.name} arrived'))
-            queue.append(process)
-        
         #Check if running process finishes
-        if running_process and running_process.burst == 0:
+        if running_process and running_process.remaining == 0:
             running_process.end_time = current_time
-            log.append((current_time, f'{running_process.name} finished'))
+            log.emit(current_time, 'finished', running_process.name)
+            running_process = None
+
+        #Let the policy take the CPU away; a process with nothing left to run finishes instead
+        preempted = False
+        if running_process and policy.should_preempt(running_process, current_time):
+            if running_process.remaining > 0:
+                policy.on_preempt(running_process, current_time)
+            else:
+                running_process.end_time = current_time
+                log.emit(current_time, 'finished', running_process.name)
             running_process = None
+            preempted = True
 
-        #If there is no running process, select one from the queue
-        if running_process is None and queue:
-            running_process = queue.pop(0)
-            log.append((current_time, f'{running_process.name} selected (burst {running_process.burst:>3})'))
-            if running_process.start_time is None:
-                running_process.start_time = current_time
+        #If there is no running process, select one
+        if running_process is None:
+            running_process = policy.pick_next(current_time)
+            if running_process:
+                log.emit(current_time, 'selected', running_process.name, running_process.remaining)
+                policy.on_dispatch(running_process, current_time)
+                if running_process.start_time is None and (not preempted or policy.preemption_sets_start_time):
+                    running_process.start_time = current_time
 
-        #Execute the running process
+        #The next event is an arrival, a completion, a policy decision or the end of the run
+        next_time = run_for
+        if schedule.next_arrival() is not None:
+            next_time = min(next_time, schedule.next_arrival())
         if running_process:
-            running_process.burst -= 1
+            if running_process.remaining > 0:
+                next_time = min(next_time, current_time + running_process.remaining)
+            decision_time = policy.next_decision(running_process, current_time)
+            if decision_time is not None:
+                next_time = min(next_time, decision_time)
 
-        #Log idle time only if no process is running and no new arrivals
-        if running_process is None and not arrivals and not queue:
-            log.append((current_time, 'Idle'))
+        #Execute the running process until the next event
+        if running_process:
+            running_process.remaining -= next_time - current_time
+            policy.on_run(running_process, next_time - current_time)
 
-        current_time += 1
+        #Log the idle stretch until the next event as a single span
+        if running_process is None:
+            log.idle(current_time, next_time - current_time)
 
-    #Ensure the log shows idle times until the end of the run time
-    while current_time < run_for:
-        log.append((current_time, 'Idle'))
-        current_time += 1
+        current_time = next_time
 
-    metrics = calculate_metrics(processes)
-    return log, metrics
+    return calculate_metrics(schedule.processes)
 
-def sjf(processes, run_for):
-    processes.sort(key=lambda p: p.arrival)
+def simulate_smp(schedule, run_for, policies, shared, log, checkpoint=None, resume=None):
+    #N-CPU version of simulate(): one policy per CPU and a heap of per-CPU event times, so an event
+    #only touches the CPUs it concerns instead of every core
+    if resume is None:
+        schedule.reset()
+    cpus = len(policies)
+    running = [None] * cpus
+    charged_until = [0] * cpus
+    busy = [0] * cpus
+    #Heap entries carry the CPU's dispatch number so entries from an earlier dispatch can be skipped
+    dispatches = [0] * cpus
+    events = []
+    #Shared queues only: max-heap of preemption ranks (projected finish times unless the policy says otherwise)
+    longest = []
+    #Time of each CPU's pending event, so an earlier policy decision can replace it
+    pending = [None] * cpus
+    idle = list(range(cpus))
+    queued = 0
+    next_cpu = 0
     current_time = 0
-    log = []
-    ready_queue = []
-    running_process = None
+    if resume is not None:
+        current_time, running, charged_until, busy, dispatches, events, longest, pending, idle, queued, next_cpu = resume
 
-    while current_time < run_for:
-        #Check for new arrivals and log them first
-        arrivals = [p for p in processes if p.arrival == current_time]
-        for process in arrivals:
-            log.append((current_time, f'{process.name} arrived'))
-            ready_queue.append(process)
-            ready_queue.sort(key=lambda p: p.burst)
-
-        #Execute the running process and handle completion
-        if running_process:
-            running_process.burst -= 1
-            if running_process.burst == 0:
-                running_process.end_time = current_time
-                log.append((current_time, f'{running_process.name} finished'))
-                running_process = None
-
-        #Handle preemption if a new process arrives with shorter burst time
-        if running_process and ready_queue and ready_queue[0].burst < running_process.burst:
-            ready_queue.append(running_process)
-            ready_queue.sort(key=lambda p: p.burst)
-            running_process = ready_queue.pop(0)
-            log.append((current_time, f'{running_process.name} selected (burst {running_process.burst:>3})'))
-
-        #Select the next process if none is running 
-        if not running_process and ready_queue:
-            running_process = ready_queue.pop(0)
-            log.append((current_time, f'{running_process.name} selected (burst {running_process.burst:>3})'))
-            if running_process.start_time is None:
-                running_process.start_time = current_time
-
-        #Log idle time if no process is running and no new arrivals
-        if not running_process and not ready_queue and not arrivals:
-            log.append((current_time, 'Idle'))
-
-        current_time += 1
-    
-    #Ensure the log shows idle times until the end of the run time
-    while current_time < run_for:
-        log.append((current_time, 'Idle'))
-        current_time += 1
+    def charge(cpu, current_time):
+        elapsed = current_time - charged_until[cpu]
+        if elapsed:
+            running[cpu].remaining -= elapsed
+            policies[cpu].on_run(running[cpu], elapsed)
+            busy[cpu] += elapsed
+            charged_until[cpu] = current_time
 
-    metrics = calculate_metrics(processes)
-    return log, metrics
+    def release(cpu, current_time):
+        #Takes the process off the CPU: it finishes if it has nothing left to run, otherwise it is queued again
+        nonlocal queued
+        process = running[cpu]
+        if process.remaining > 0:
+            policies[cpu].on_preempt(process, current_time)
+            queued += 1
+            log.release(current_time, cpu)
+        else:
+            process.end_time = current_time
+            log.emit(current_time, 'finished', process.name, None, cpu)
+        running[cpu] = None
+        dispatches[cpu] += 1
 
-def rr(processes, run_for, quantum):
-    processes.sort(key=lambda p: p.arrival)
-    current_time = 0
-    log = []
-    queue = []
-    time_slice = 0
-    running_process = None
+    def dispatch(cpu, process, current_time, preempted):
+        running[cpu] = process
+        charged_until[cpu] = current_time
+        dispatches[cpu] += 1
+        policy = policies[cpu]
+        log.emit(current_time, 'selected', process.name, process.remaining, cpu)
+        policy.on_dispatch(process, current_time)
+        if process.start_time is None and (not preempted or policy.preemption_sets_start_time):
+            process.start_time = current_time
+        if shared and process.remaining > 0:
+            push_longest(cpu, process, current_time)
+        schedule_event(cpu, current_time)
+
+    def push_longest(cpu, process, current_time):
+        #Stale entries are only popped while work is queued, so the heap is rebuilt from the live ones (at most one
+        #per CPU) whenever it outgrows the CPU count
+        if len(longest) > 2 * cpus:
+            longest[:] = [entry for entry in longest if entry[2] == dispatches[entry[1]]]
+            heapq.heapify(longest)
+        heapq.heappush(longest, (-policies[cpu].preemption_rank(process, current_time), cpu, dispatches[cpu]))
+
+    def schedule_event(cpu, current_time):
+        #The CPU's next completion or policy decision, whichever comes first
+        process = running[cpu]
+        event_time = policies[cpu].next_decision(process, current_time)
+        if process.remaining > 0:
+            finish_time = current_time + process.remaining
+            event_time = finish_time if event_time is None else min(event_time, finish_time)
+        pending[cpu] = event_time
+        if event_time is not None:
+            heapq.heappush(events, (event_time, cpu, dispatches[cpu]))
+
+    def reschedule(cpu, current_time):
+        #New work in the queue can bring a policy decision (such as an aging step) forward; the old
+        #entries are dropped by giving the CPU a new dispatch number
+        process = running[cpu]
+        decision_time = policies[cpu].next_decision(process, current_time)
+        if decision_time is None or (pending[cpu] is not None and decision_time >= pending[cpu]):
+            return
+        dispatches[cpu] += 1
+        if shared and process.remaining > 0:
+            push_longest(cpu, process, current_time)
+        schedule_event(cpu, current_time)
+
+    def take_work(cpu, current_time):
+        #Own (or shared) queue first; an idle CPU with an empty per-CPU queue steals from the longest queue of a busy
+        #CPU, since an idle one takes its own work
+        nonlocal queued
+        policy = policies[cpu]
+        if not policy.queue and not shared:
+            #Only runs when a CPU would otherwise go idle, not on every event
+            victim = max((other for other in range(cpus) if running[other] is not None and policies[other].queue),
+                         key=lambda other: len(policies[other].queue), default=None)
+            process = None if victim is None else policy.steal_from(policies[victim], current_time)
+        else:
+            process = policy.pick_next(current_time)
+        if process is not None:
+            queued -= 1
+        return process
+
+    def check_preemption(cpu, current_time):
+        nonlocal queued
+        policy = policies[cpu]
+        charge(cpu, current_time)
+        if not policy.should_preempt(running[cpu], current_time):
+            reschedule(cpu, current_time)
+            return False
+        release(cpu, current_time)
+        process = policy.pick_next(current_time)
+        queued -= 1
+        dispatch(cpu, process, current_time, True)
+        return True
 
     while current_time < run_for:
 
-        #Check for new arrivals
-        arrivals = [p for p in processes if p.arrival == current_time]
-        for process in arrivals:
-            log.append((current_time, f'{process.name} arrived'))
-            queue.append(process)
-
-        #Handle time slice expiration or process completion
-        if running_process and (time_slice == quantum or running_process.burst == 0):
-            if running_process.burst > 0:
-                queue.append(running_process)
+        if checkpoint is not None and checkpoint.due():
+            checkpoint.save(schedule, policies, log, (current_time, running, charged_until, busy, dispatches, events,
+                                                      longest, pending, idle, queued, next_cpu))
+
+        #Check for new arrivals; per-CPU queues take them in turn and idle CPUs steal to balance
+        arrived_on = set()
+        for process in schedule.pop_arrivals(current_time):
+            log.emit(current_time, 'arrived', process.name)
+            if shared:
+                policies[0].on_arrival(process, current_time)
             else:
-                running_process.end_time = current_time
-                log.append((current_time, f'{running_process.name} finished'))
-            running_process = None
-            time_slice = 0
+                policies[next_cpu].on_arrival(process, current_time)
+                arrived_on.add(next_cpu)
+                next_cpu = (next_cpu + 1) % cpus
+            queued += 1
 
-        #Select the next process if none is running
-        if not running_process and queue:
-            running_process = queue.pop(0)
-            log.append((current_time, f'{running_process.name} selected (burst {running_process.burst:>3})'))
-            if running_process.start_time is None:
-                running_process.start_time = current_time
+        #Completions and policy decisions that are due now, in CPU order
+        released = set()
+        while events and events[0][0] <= current_time:
+            event_time, cpu, dispatch_number = heapq.heappop(events)
+            if dispatch_number != dispatches[cpu]:
+                continue
+            charge(cpu, current_time)
+            process = running[cpu]
+            if process.remaining == 0 or policies[cpu].should_preempt(process, current_time):
+                release(cpu, current_time)
+                heapq.heappush(idle, cpu)
+                if process.remaining > 0:
+                    released.add(cpu)
+            else:
+                schedule_event(cpu, current_time)
 
-        #Execute the running process
-        if running_process:
-            running_process.burst -= 1
-            time_slice += 1
+        #Idle CPUs pick up work: those with their own queued work first, then those whose process was just queued again so
+        #it can stay where it ran, then the rest in CPU order; with per-CPU queues the ones left steal last
+        if idle and queued:
+            for cpu in sorted(idle, key=lambda cpu: (not policies[cpu].queue, cpu not in released, cpu)):
+                if not queued:
+                    break
+                process = take_work(cpu, current_time)
+                if process is not None:
+                    idle.remove(cpu)
+                    dispatch(cpu, process, current_time, False)
+            heapq.heapify(idle)
 
-        #Log idle time if no process is running and no new arrivals
-        if not running_process and not queue and not arrivals:
-            log.append((current_time, 'Idle'))
+        #Work still queued with every CPU busy may preempt a running process
+        if shared:
+            while queued and longest:
+                finish_time, cpu, dispatch_number = longest[0]
+                if dispatch_number != dispatches[cpu]:
+                    heapq.heappop(longest)
+                elif not check_preemption(cpu, current_time):
+                    break
+        else:
+            for cpu in sorted(arrived_on):
+                if running[cpu] and policies[cpu].queue:
+                    check_preemption(cpu, current_time)
 
-        current_time += 1
-    
-    #Ensure the log shows idle times until the end of the run time
-    while current_time < run_for:
-        log.append((current_time, 'Idle'))
-        current_time += 1
-
-    metrics = calculate_metrics(processes)
-    return log, metrics
-
-def write_output(file_name, log, metrics, algorithm, quantum, run_for):
-    # Generate .out file
-    output_file_txt = file_name.replace('.in', '.out')
-    with open(output_file_txt, 'w') as file:
-        file.write(f"{len(metrics):>3} processes\n")  # Adjusted space to ensure 3-character width
-        if algorithm == 'fcfs':
-            file.write(f"Using First-Come First-Served\n")
-        elif algorithm == 'sjf':
-            file.write(f"Using preemptive Shortest Job First\n")  # Ensure consistent naming
-        elif algorithm == 'rr':
-            file.write(f"Using Round-Robin\n")
-            file.write(f"Quantum {quantum:>3}\n\n")
-        for entry in log:
-            file.write(f"Time {entry[0]:>3} : {entry[1]}\n")
-        file.write(f"Finished at time {run_for:>3}\n\n")
-        for name, metric in sorted(metrics.items()):
-            file.write(f"{name:<2} wait {metric['wait']:>3} turnaround {metric['turnaround']:>3} response {metric['response']:>3}\n")
-    
-    # Generate .html file
-    output_file_html = file_name.replace('.in', '.html')
-    with open(output_file_html, 'w') as file:
-        file.write("<html><body>\n")
-        file.write(f"<h2>{len(metrics)} processes</h2>\n")
-        if algorithm == 'fcfs':
-            file.write(f"<h3>Using First-Come First-Served</h3>\n")
-        elif algorithm == 'sjf':
-            file.write(f"<h3>Using preemptive Shortest Job First</h3>\n")
-        elif algorithm == 'rr':
-            file.write(f"<h3>Using Round-Robin</h3>\n")
-            file.write(f"<p>Quantum {quantum}</p>\n")
-        
-        file.write("<table border='1'>\n")
-        file.write("<tr><th>Time</th><th>Event</th></tr>\n")
-        for entry in log:
-            if "arrived" in entry[1]:
-                file.write(f"<tr><td>{entry[0]:>3}</td><td style='color:green'>{entry[1]}</td></tr>\n")  # Green for arrival
-            elif "selected" in entry[1]:
-                file.write(f"<tr><td>{entry[0]:>3}</td><td style='color:blue'>{entry[1]}</td></tr>\n")  # Blue for selection
-            elif "finished" in entry[1]:
-                file.write(f"<tr><td>{entry[0]:>3}</td><td style='color:red'>{entry[1]}</td></tr>\n")  # Red for finish
+        #The next event is an arrival, a CPU event or the end of the run
+        while events and events[0][2] != dispatches[events[0][1]]:
+            heapq.heappop(events)
+        next_time = run_for
+        if schedule.next_arrival() is not None:
+            next_time = min(next_time, schedule.next_arrival())
+        if events:
+            next_time = min(next_time, events[0][0])
+
+        #The machine is idle only when every CPU is
+        if len(idle) == cpus:
+            log.idle(current_time, next_time - current_time)
+
+        current_time = next_time
+
+    #Charge every CPU that is still running up to the end of the run
+    for cpu in range(cpus):
+        if running[cpu]:
+            charge(cpu, run_for)
+
+    metrics = calculate_metrics(schedule.processes)
+    metrics.cpu_busy = busy
+    return metrics
+
+def idle_lines(prefix, suffix, start, end):
+    #prefix + time + suffix for every time in [start, end), with times padded to three characters. From 100 on
+    #the padding does nothing, so those lines come from one join over str() instead of a format per line
+    lines = "".join([f"{prefix}{time:>3}{suffix}" for time in range(start, min(end, 100))])
+    if end > max(start, 100):
+        lines += prefix + (suffix + prefix).join(map(str, range(max(start, 100), end))) + suffix
+    return lines
+
+def event_text(kind, name, burst=None, cpu=None):
+    #How an event reads in the .out and .html files; burst is given for selections, cpu on N-CPU runs
+    event = f'{name} {kind}' if burst is None else f'{name} {kind} (burst {burst:>3})'
+    return event if cpu is None else f'{event} on CPU {cpu}'
+
+#OutputWriter keeps up to this many events as records before rendering them as one block
+OUTPUT_BLOCK_EVENTS = 8192
+#Idle stretches are expanded into lines this many ticks at a time
+IDLE_CHUNK = 4096
+
+class OutputWriter:
+    #Writes the .out and .html files. Events are held as (time, kind, name, burst, cpu) records and rendered a
+    #block at a time, so the event log is never held in memory and each line is formatted only once
+    def __init__(self, file_name, process_count, title, quantum, collapse_idle=False, cpus=1, shared=True, buffer_size=1 << 20, resume_offsets=None):
+        self.collapse_idle = collapse_idle
+        #Idle stretches are records too, with kind None and the length in place of the burst
+        self.pending = []
+        if resume_offsets is not None:
+            #Cut both files back to where the checkpoint left them and carry on writing from there
+            self.out = open(output_path(file_name, '.out'), 'r+', buffering=buffer_size)
+            self.html = open(output_path(file_name, '.html'), 'r+', buffering=buffer_size)
+            for file, offset in zip((self.out, self.html), resume_offsets):
+                file.seek(offset)
+                file.truncate()
+            return
+        self.out = open(output_path(file_name, '.out'), 'w', buffering=buffer_size)
+        self.html = open(output_path(file_name, '.html'), 'w', buffering=buffer_size)
+
+        self.out.write(f"{process_count:>3} processes\n")  # Adjusted space to ensure 3-character width
+        self.out.write(f"Using {title}\n")
+        if cpus > 1:
+            self.out.write(f"CPUs {cpus:>3} ({'shared queue' if shared else 'per-CPU queues with work stealing'})\n")
+        if quantum is not None:
+            self.out.write(f"Quantum {quantum:>3}\n\n")
+
+        self.html.write("<html><body>\n")
+        self.html.write(f"<h2>{process_count} processes</h2>\n")
+        self.html.write(f"<h3>Using {title}</h3>\n")
+        if cpus > 1:
+            self.html.write(f"<p>CPUs {cpus} ({'shared queue' if shared else 'per-CPU queues with work stealing'})</p>\n")
+        if quantum is not None:
+            self.html.write(f"<p>Quantum {quantum}</p>\n")
+        self.html.write("<table border='1'>\n")
+        self.html.write("<tr><th>Time</th><th>Event</th></tr>\n")
+
+    def emit(self, time, kind, name, burst=None, cpu=None):
+        self.pending.append((time, kind, name, burst, cpu))
+        if len(self.pending) >= OUTPUT_BLOCK_EVENTS:
+            self.render()
+
+    def idle(self, start, length):
+        self.pending.append((start, None, None, length, None))
+        if len(self.pending) >= OUTPUT_BLOCK_EVENTS:
+            self.render()
+
+    def release(self, time, cpu):
+        #The text files show the next selection instead
+        pass
+
+    def render(self):
+        #Formats every pending record once for both files and writes each file with one join per block
+        out_lines = []
+        html_lines = []
+        for time, kind, name, burst, cpu in self.pending:
+            if kind is None:
+                self.write_lines(out_lines, html_lines)
+                self.render_idle(time, burst)
+                continue
+            event = event_text(kind, name, burst, cpu)
+            time = f'{time:>3}'
+            out_lines.append(f"Time {time} : {event}\n")
+            if "arrived" in event:
+                style = " style='color:green'"  # Green for arrival
+            elif "selected" in event:
+                style = " style='color:blue'"  # Blue for selection
+            elif "finished" in event:
+                style = " style='color:red'"  # Red for finish
+            else:
+                style = ""  # Default color
+            html_lines.append(f"<tr><td>{time}</td><td{style}>{event}</td></tr>\n")
+        self.write_lines(out_lines, html_lines)
+        self.pending = []
+
+    def write_lines(self, out_lines, html_lines):
+        if out_lines:
+            self.out.write("".join(out_lines))
+            self.html.write("".join(html_lines))
+            out_lines.clear()
+            html_lines.clear()
+
+    def render_idle(self, start, length):
+        #The .out format has one Idle line per tick, so the span is only expanded here, a chunk at a time
+        for chunk_start in range(start, start + length, IDLE_CHUNK):
+            chunk_end = min(chunk_start + IDLE_CHUNK, start + length)
+            self.out.write(idle_lines("Time ", " : Idle\n", chunk_start, chunk_end))
+        if self.collapse_idle and length > 1:
+            self.html.write(f"<tr><td>{start:>3}-{start + length - 1}</td><td>Idle ({length} ticks)</td></tr>\n")
+        else:
+            for chunk_start in range(start, start + length, IDLE_CHUNK):
+                chunk_end = min(chunk_start + IDLE_CHUNK, start + length)
+                self.html.write(idle_lines("<tr><td>", "</td><td>Idle</td></tr>\n", chunk_start, chunk_end))
+
+    def checkpoint(self):
+        #Renders what is pending, flushes both files and returns where they end
+        self.render()
+        self.out.flush()
+        self.html.flush()
+        return self.out.tell(), self.html.tell()
+
+    def close(self, run_for, metrics, report=()):
+        self.render()
+        self.out.write(f"Finished at time {run_for:>3}\n\n")
+        rows = list(metrics.rows())
+        self.out.write("".join([f"{name:<2} wait {wait:>3} turnaround {turnaround:>3} response {response:>3}\n"
+                                for name, wait, turnaround, response in rows]))
+        if len(metrics.cpu_busy) > 1:
+            self.out.write("\n")
+            for cpu, busy in enumerate(metrics.cpu_busy):
+                utilization = busy / run_for if run_for > 0 else 0
+                self.out.write(f"CPU {cpu:>3} busy {busy:>3} utilization {utilization:>7.2%}\n")
+        if report:
+            self.out.write("\n")
+            for label, columns in report:
+                self.out.write(label + "".join(f" {column} {value:>3}" for column, value in columns) + "\n")
+        self.out.close()
+
+        self.html.write("</table>\n")
+        self.html.write(f"<p>Finished at time {run_for}</p>\n")
+        self.html.write("<table border='1'>\n")
+        self.html.write("<tr><th>Process</th><th>Wait Time</th><th>Turnaround Time</th><th>Response Time</th></tr>\n")
+        self.html.write("".join([f"<tr><td>{name}</td><td>{wait}</td><td>{turnaround}</td><td>{response}</td></tr>\n"
+                                 for name, wait, turnaround, response in rows]))
+        self.html.write("</table>\n")
+        if len(metrics.cpu_busy) > 1:
+            self.html.write("<table border='1'>\n")
+            self.html.write("<tr><th>CPU</th><th>Busy Time</th><th>Utilization</th></tr>\n")
+            for cpu, busy in enumerate(metrics.cpu_busy):
+                utilization = busy / run_for if run_for > 0 else 0
+                self.html.write(f"<tr><td>{cpu}</td><td>{busy}</td><td>{utilization:.2%}</td></tr>\n")
+            self.html.write("</table>\n")
+        if report:
+            self.html.write("<table border='1'>\n")
+            self.html.write("<tr><th></th>" + "".join(f"<th>{column}</th>" for column, _ in report[0][1]) + "</tr>\n")
+            for label, columns in report:
+                self.html.write(f"<tr><td>{label}</td>" + "".join(f"<td>{value}</td>" for _, value in columns) + "</tr>\n")
+            self.html.write("</table>\n")
+        self.html.write("</body></html>\n")
+        self.html.close()
+
+class JsonLinesLog:
+    #Event sink writing one JSON object per line to an open text stream, idle stretches as one record with a length
+    def __init__(self, file):
+        self.file = file
+        #Names are escaped once, not on every event
+        self.names = {}
+
+    def emit(self, time, kind, name, burst=None, cpu=None):
+        if name not in self.names:
+            self.names[name] = json.dumps(name)
+        record = f'{{"time": {time}, "event": "{kind}", "process": {self.names[name]}'
+        if burst is not None:
+            record += f', "burst": {burst}'
+        if cpu is not None:
+            record += f', "cpu": {cpu}'
+        self.file.write(record + '}\n')
+
+    def idle(self, start, length):
+        self.file.write(f'{{"time": {start}, "event": "idle", "length": {length}}}\n')
+
+    def release(self, time, cpu):
+        pass
+
+class JsonLinesWriter(JsonLinesLog):
+    #--format jsonl: the event stream in .events.jsonl and the per-process metrics as a .metrics.json file
+    #holding one list per column
+    def __init__(self, file_name, buffer_size=1 << 20, resume_offsets=None):
+        super().__init__(open_export(output_path(file_name, '.events.jsonl'), buffer_size, resume_offsets))
+        self.metrics_file = output_path(file_name, '.metrics.json')
+
+    def checkpoint(self):
+        self.file.flush()
+        return (self.file.tell(),)
+
+    def close(self, run_for, metrics, report=()):
+        self.file.close()
+        with open(self.metrics_file, 'w') as file:
+            json.dump(metrics.columns(), file)
+
+class CsvWriter:
+    #Event stream as CSV rows (time, event, process, burst, cpu, length) and the per-process metrics as .metrics.csv
+    def __init__(self, file_name, buffer_size=1 << 20, resume_offsets=None):
+        self.metrics_file = output_path(file_name, '.metrics.csv')
+        self.file = open_export(output_path(file_name, '.events.csv'), buffer_size, resume_offsets)
+        self.writer = csv.writer(self.file, lineterminator='\n')
+        if resume_offsets is None:
+            self.writer.writerow(('time', 'event', 'process', 'burst', 'cpu', 'length'))
+
+    def emit(self, time, kind, name, burst=None, cpu=None):
+        self.writer.writerow((time, kind, name, burst, cpu, None))
+
+    def idle(self, start, length):
+        self.writer.writerow((start, 'idle', None, None, None, length))
+
+    def release(self, time, cpu):
+        pass
+
+    def checkpoint(self):
+        self.file.flush()
+        return (self.file.tell(),)
+
+    def close(self, run_for, metrics, report=()):
+        self.file.close()
+        columns = metrics.columns()
+        with open(self.metrics_file, 'w', newline='') as file:
+            writer = csv.writer(file, lineterminator='\n')
+            writer.writerow(columns)
+            writer.writerows(zip(*columns.values()))
+
+def open_export(file_name, buffer_size, resume_offsets):
+    #A fresh file, or on resume the existing one cut back to its checkpointed length
+    if resume_offsets is None:
+        return open(file_name, 'w', buffering=buffer_size, newline='')
+    file = open(file_name, 'r+', buffering=buffer_size, newline='')
+    file.seek(resume_offsets[0])
+    file.truncate()
+    return file
+
+class TeeLog:
+    #Sends every event to several writers, for runs asking for more than one --format
+    def __init__(self, logs):
+        self.logs = logs
+
+    def emit(self, time, kind, name, burst=None, cpu=None):
+        for log in self.logs:
+            log.emit(time, kind, name, burst, cpu)
+
+    def idle(self, start, length):
+        for log in self.logs:
+            log.idle(start, length)
+
+    def release(self, time, cpu):
+        for log in self.logs:
+            log.release(time, cpu)
+
+    def checkpoint(self):
+        return tuple(log.checkpoint() for log in self.logs)
+
+    def close(self, run_for, metrics, report=()):
+        for log in self.logs:
+            log.close(run_for, metrics, report)
+
+#--format report: events are deflated this many at a time, each block on its own so a checkpoint can resume between them
+REPORT_BLOCK_EVENTS = 65536
+REPORT_KINDS = {'arrived': 0, 'selected': 1, 'finished': 2}
+
+REPORT_HEAD = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body{font-family:sans-serif;margin:1em}
+canvas{width:100%;border:1px solid #999;cursor:grab;display:block}
+.table{height:420px;overflow-y:auto;border:1px solid #999;font-family:monospace}
+.table>div{position:relative}
+.row{position:absolute;left:0;right:0;height:20px;line-height:20px;white-space:pre;padding-left:4px}
+.arrived{color:green}.selected{color:blue}.finished{color:red}
+#tip{position:fixed;background:#ffe;border:1px solid #999;padding:2px 4px;display:none;font-size:12px;pointer-events:none}
+table{border-collapse:collapse;margin:0.5em 0}td,th{border:1px solid #999;padding:1px 6px}
+</style></head><body>
+<h2>{processes} processes</h2>
+<h3>Using {title}</h3>
+{details}<p id="status">Loading...</p>
+<h4>Timeline</h4>
+<canvas id="gantt"></canvas>
+<p><button id="reset">Reset zoom</button> Scroll to zoom, drag to pan, click to show the events at that time.</p>
+<h4>Events</h4>
+<p><button id="events-prev">&lt;</button> <span id="events-page"></span> <button id="events-next">&gt;</button>
+Go to time <input id="goto" size="10"></p>
+<div class="table" id="events"></div>
+<h4>Metrics</h4>
+<p><button id="metrics-prev">&lt;</button> <span id="metrics-page"></span> <button id="metrics-next">&gt;</button></p>
+<div class="table" id="metrics"></div>
+<div id="extra"></div>
+<div id="tip"></div>
+<script id="data" type="application/octet-stream">
+"""
+
+REPORT_SCRIPT = """</script>
+<script>
+(async function () {
+  const PAGE = 10000, ROW = 20, KINDS = ['arrived', 'selected', 'finished'];
+  const status = document.getElementById('status');
+  if (typeof DecompressionStream === 'undefined') {
+    status.textContent = 'This browser cannot read the report data (DecompressionStream is not supported).';
+    return;
+  }
+  //Every line of the data block is a base64 piece of one raw deflate stream
+  const pieces = document.getElementById('data').textContent.trim().split(/\\s+/)
+    .map(piece => Uint8Array.from(atob(piece), c => c.charCodeAt(0)));
+  const stream = new Blob(pieces).stream().pipeThrough(new DecompressionStream('deflate-raw'));
+  const data = JSON.parse(await new Response(stream).text());
+  const meta = data.meta, names = data.names, raw = data.events;
+  const stride = meta.cpus > 1 ? 5 : 4, records = raw.length / stride;
+
+  //Events are [time delta, kind, process, burst or idle length(, cpu)]; kind 3 is an idle stretch and kind 4 a CPU
+  //putting its process back in the queue, which only the Gantt chart uses
+  const time = new Float64Array(records), kind = new Int8Array(records), proc = new Int32Array(records);
+  const value = new Float64Array(records), cpu = new Int32Array(records);
+  const releaseAt = [], releaseTime = [], releaseCpu = [];
+  let count = 0;
+  for (let j = 0, t = 0; j < raw.length; j += stride) {
+    t += raw[j];
+    if (raw[j + 1] === 4) { releaseAt.push(count); releaseTime.push(t); releaseCpu.push(raw[j + 4]); continue; }
+    time[count] = t; kind[count] = raw[j + 1]; proc[count] = raw[j + 2]; value[count] = raw[j + 3];
+    cpu[count] = stride === 5 ? raw[j + 4] : -1;
+    count++;
+  }
+  status.textContent = `${count} events, finished at time ${meta.run_for}`;
+
+  const pad = x => String(x).padStart(3);
+  function eventText(i) {
+    if (kind[i] === 3) return value[i] > 1 ? `Idle (${value[i]} ticks)` : 'Idle';
+    let text = names[proc[i]] + ' ' + KINDS[kind[i]];
+    if (kind[i] === 1) text += ` (burst ${pad(value[i])})`;
+    if (cpu[i] >= 0) text += ` on CPU ${cpu[i]}`;
+    return text;
+  }
+  function eventRow(i) {
+    const when = kind[i] === 3 && value[i] > 1 ? `${pad(time[i])}-${time[i] + value[i] - 1}` : pad(time[i]);
+    const text = eventText(i);
+    //Same colouring as the .html writer
+    const cls = text.includes('arrived') ? 'arrived' : text.includes('selected') ? 'selected' : text.includes('finished') ? 'finished' : '';
+    return [`Time ${when} : ${text}`, cls];
+  }
+  function lowerBound(values, x, length = values.length) {
+    //First index whose value is above x
+    let lo = 0, hi = length;
+    while (lo < hi) {
+      const mid = (lo + hi) >> 1;
+      if (values[mid] <= x) lo = mid + 1; else hi = mid;
+    }
+    return lo;
+  }
+
+  function pagedTable(name, rows, render) {
+    //Only the rows scrolled into view are in the DOM, and at most PAGE rows are scrollable at once
+    const box = document.getElementById(name), body = document.createElement('div');
+    const label = document.getElementById(name + '-page'), pages = Math.max(1, Math.ceil(rows / PAGE));
+    box.appendChild(body);
+    let page = 0;
+    const pageRows = () => Math.min(PAGE, rows - page * PAGE);
+    function paint() {
+      const first = Math.floor(box.scrollTop / ROW);
+      const last = Math.min(pageRows(), first + Math.ceil(box.clientHeight / ROW) + 1);
+      body.textContent = '';
+      for (let r = first; r < last; r++) {
+        const [text, cls] = render(page * PAGE + r), row = document.createElement('div');
+        row.className = 'row ' + cls;
+        row.style.top = r * ROW + 'px';
+        row.textContent = text;
+        body.appendChild(row);
+      }
+      label.textContent = `page ${page + 1} of ${pages}, rows ${Math.min(rows, page * PAGE + 1)}-${page * PAGE + pageRows()} of ${rows}`;
+    }
+    function show(newPage, row = 0) {
+      page = Math.max(0, Math.min(pages - 1, newPage));
+      body.style.height = pageRows() * ROW + 'px';
+      box.scrollTop = row * ROW;
+      paint();
+    }
+    box.addEventListener('scroll', paint);
+    document.getElementById(name + '-prev').onclick = () => show(page - 1);
+    document.getElementById(name + '-next').onclick = () => show(page + 1);
+    show(0);
+    return index => show(Math.floor(index / PAGE), index % PAGE);
+  }
+
+  const showEvent = pagedTable('events', count, eventRow);
+  const metrics = data.metrics;
+  pagedTable('metrics', metrics.process.length, i => [
+    `${names[metrics.process[i]].padEnd(2)} wait ${pad(metrics.wait[i])} turnaround ${pad(metrics.turnaround[i])} response ${pad(metrics.response[i])}`
+    + (metrics.finished[i] ? '' : '  (not finished)'), '']);
+  function goToTime(t) { showEvent(Math.min(count - 1, Math.max(0, lowerBound(time, t - 1)))); }
+  document.getElementById('goto').addEventListener('change', e => goToTime(Number(e.target.value)));
+
+  //Gantt lanes: one per CPU, a bar from each selection to the next selection, finish or release on that CPU
+  const lanes = Math.max(1, meta.cpus), starts = [], ends = [], owners = [];
+  const running = new Array(lanes).fill(-1), since = new Array(lanes).fill(0);
+  for (let c = 0; c < lanes; c++) { starts.push([]); ends.push([]); owners.push([]); }
+  function close(c, at) {
+    if (running[c] >= 0 && at > since[c]) { starts[c].push(since[c]); ends[c].push(at); owners[c].push(running[c]); }
+    running[c] = -1;
+  }
+  let r = 0;
+  for (let i = 0; i < count; i++) {
+    for (; r < releaseAt.length && releaseAt[r] <= i; r++) close(releaseCpu[r], releaseTime[r]);
+    if (kind[i] !== 1 && kind[i] !== 2) continue;
+    const c = Math.max(0, cpu[i]);
+    close(c, time[i]);
+    if (kind[i] === 1) { running[c] = proc[i]; since[c] = time[i]; }
+  }
+  for (; r < releaseAt.length; r++) close(releaseCpu[r], releaseTime[r]);
+  for (let c = 0; c < lanes; c++) close(c, meta.run_for);
+
+  const canvas = document.getElementById('gantt'), ctx = canvas.getContext('2d'), tip = document.getElementById('tip');
+  const LANE = Math.max(6, Math.min(24, Math.floor(480 / lanes))), TOP = 22, fullSpan = Math.max(1, meta.run_for);
+  let view0 = 0, view1 = fullSpan;
+  const colour = p => `hsl(${(p * 137.508) % 360},60%,55%)`;
+  function niceStep(span) {
+    const base = Math.pow(10, Math.floor(Math.log10(Math.max(span, 1))));
+    return [1, 2, 5, 10].map(m => m * base).find(step => span / step <= 10);
+  }
+  function draw() {
+    const w = canvas.width = canvas.clientWidth;
+    canvas.height = TOP + lanes * LANE;
+    const scale = w / (view1 - view0);
+    ctx.clearRect(0, 0, w, canvas.height);
+    ctx.fillStyle = '#000';
+    ctx.font = '11px sans-serif';
+    const step = niceStep(view1 - view0);
+    for (let x = Math.ceil(view0 / step) * step; x <= view1; x += step) {
+      const px = (x - view0) * scale;
+      ctx.fillRect(px, TOP - 6, 1, 6);
+      ctx.fillText(String(x), px + 2, TOP - 9);
+    }
+    for (let c = 0; c < lanes; c++) {
+      const s = starts[c], e = ends[c], p = owners[c], y = TOP + c * LANE;
+      let drawn = -1;
+      for (let k = lowerBound(e, view0); k < s.length && s[k] < view1; k++) {
+        const x0 = Math.max(0, (s[k] - view0) * scale), x1 = Math.min(w, (e[k] - view0) * scale);
+        //Bars that end inside a pixel that is already painted are skipped
+        if (Math.floor(x1) <= drawn) continue;
+        ctx.fillStyle = colour(p[k]);
+        ctx.fillRect(x0, y + 1, Math.max(1, x1 - x0), LANE - 2);
+        drawn = Math.floor(x1);
+      }
+    }
+  }
+  const timeAt = x => view0 + x / canvas.width * (view1 - view0);
+  let drag = null;
+  canvas.addEventListener('wheel', e => {
+    e.preventDefault();
+    const at = timeAt(e.offsetX), span = Math.min(fullSpan, Math.max(10, (view1 - view0) * (e.deltaY > 0 ? 1.25 : 0.8)));
+    view0 = Math.max(0, Math.min(fullSpan - span, at - (at - view0) * span / (view1 - view0)));
+    view1 = view0 + span;
+    draw();
+  }, {passive: false});
+  canvas.addEventListener('mousedown', e => { drag = {x: e.offsetX, view0, moved: false}; });
+  window.addEventListener('mouseup', e => {
+    if (drag && !drag.moved && e.target === canvas) goToTime(Math.floor(timeAt(e.offsetX)));
+    drag = null;
+  });
+  canvas.addEventListener('mousemove', e => {
+    if (drag) {
+      const span = view1 - view0, shift = (drag.x - e.offsetX) / canvas.width * span;
+      drag.moved = drag.moved || Math.abs(drag.x - e.offsetX) > 2;
+      view0 = Math.max(0, Math.min(fullSpan - span, drag.view0 + shift));
+      view1 = view0 + span;
+      draw();
+      return;
+    }
+    const lane = Math.floor((e.offsetY - TOP) / LANE), at = timeAt(e.offsetX);
+    const k = lane >= 0 && lane < lanes ? lowerBound(ends[lane], at) : -1;
+    if (k >= 0 && k < starts[lane].length && starts[lane][k] <= at) {
+      tip.textContent = `${names[owners[lane][k]]} ${starts[lane][k]}-${ends[lane][k]}` + (meta.cpus > 1 ? ` on CPU ${lane}` : '');
+      tip.style.left = e.clientX + 12 + 'px';
+      tip.style.top = e.clientY + 12 + 'px';
+      tip.style.display = 'block';
+    } else {
+      tip.style.display = 'none';
+    }
+  });
+  canvas.addEventListener('mouseleave', () => { tip.style.display = 'none'; });
+  document.getElementById('reset').onclick = () => { view0 = 0; view1 = fullSpan; draw(); };
+  window.addEventListener('resize', draw);
+  draw();
+
+  //Per-CPU busy time and policy rows, the same as the end of the .out file
+  const extra = document.getElementById('extra');
+  function table(header, rows) {
+    const t = document.createElement('table'), head = t.insertRow();
+    header.forEach(h => { const th = document.createElement('th'); th.textContent = h; head.appendChild(th); });
+    rows.forEach(r => { const tr = t.insertRow(); r.forEach(v => { tr.insertCell().textContent = v; }); });
+    extra.appendChild(t);
+  }
+  if (meta.cpu_busy.length > 1) {
+    table(['CPU', 'Busy Time', 'Utilization'], meta.cpu_busy.map((b, c) =>
+      [c, b, (meta.run_for > 0 ? b / meta.run_for * 100 : 0).toFixed(2) + '%']));
+  }
+  if (meta.report.length) {
+    table([''].concat(meta.report[0][1].map(column => column[0])), meta.report.map(([label, columns]) => [label].concat(columns.map(column => column[1]))));
+  }
+})();
+</script>
+</body></html>
+"""
+
+class HtmlReportWriter:
+    #Self-contained .report.html that stays small for huge runs: events are kept as delta-encoded integers,
+    #raw-deflated in blocks and embedded as base64; the page draws a Gantt timeline and paged tables from them
+    def __init__(self, file_name, process_count, title, quantum, cpus=1, shared=True, buffer_size=1 << 20, resume_offsets=None):
+        self.file_name = output_path(file_name, '.report.html')
+        self.meta = {'processes': process_count, 'title': title, 'quantum': quantum, 'cpus': cpus, 'shared': shared}
+        self.with_cpu = cpus > 1
+        if resume_offsets is not None:
+            offset, self.names, self.block, self.count, self.last_time = resume_offsets
+            self.file = open(self.file_name, 'r+', buffering=buffer_size)
+            self.file.seek(offset)
+            self.file.truncate()
+            return
+        self.file = open(self.file_name, 'w', buffering=buffer_size)
+        self.names = {}
+        self.block = []
+        self.count = 0
+        self.last_time = 0
+        details = f"<p>Quantum {quantum}</p>\n" if quantum is not None else ""
+        if cpus > 1:
+            details += f"<p>CPUs {cpus} ({'shared queue' if shared else 'per-CPU queues with work stealing'})</p>\n"
+        self.file.write(REPORT_HEAD.replace('{title}', html.escape(title)).replace('{processes}', str(process_count)).replace('{details}', details))
+        self.write_block('{"events":[')
+
+    def write_block(self, text, final=False):
+        #Each block is deflated on its own and ends on a byte boundary, so the blocks join into one stream
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        data = compressor.compress(text.encode()) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_FULL_FLUSH)
+        self.file.write(base64.b64encode(data).decode() + '\n')
+
+    def add(self, time, kind, index, value, cpu):
+        if self.with_cpu:
+            self.block.append(f'{time - self.last_time},{kind},{index},{value},{cpu}')
+        else:
+            self.block.append(f'{time - self.last_time},{kind},{index},{value}')
+        self.last_time = time
+        if len(self.block) == REPORT_BLOCK_EVENTS:
+            self.flush_block()
+
+    def flush_block(self):
+        if self.block:
+            self.write_block((',' if self.count else '') + ','.join(self.block))
+            self.count += len(self.block)
+            self.block = []
+
+    def emit(self, time, kind, name, burst=None, cpu=None):
+        index = self.names.get(name)
+        if index is None:
+            index = self.names[name] = len(self.names)
+        self.add(time, REPORT_KINDS[kind], index, 0 if burst is None else burst, -1 if cpu is None else cpu)
+
+    def idle(self, start, length):
+        self.add(start, 3, -1, length, -1)
+
+    def release(self, time, cpu):
+        #Only used to end the CPU's Gantt bar, the event table leaves it out
+        self.add(time, 4, -1, 0, cpu)
+
+    def checkpoint(self):
+        #The events of the unfinished block go into the checkpoint instead of the file
+        self.file.flush()
+        return self.file.tell(), self.names, self.block, self.count, self.last_time
+
+    def close(self, run_for, metrics, report=()):
+        self.flush_block()
+        columns = metrics.columns()
+        processes = [self.names.setdefault(name, len(self.names)) for name in columns.pop('name')]
+        self.meta.update(run_for=run_for, cpu_busy=[int(busy) for busy in metrics.cpu_busy], report=list(report))
+        self.write_block(f'],"names":{json.dumps(list(self.names))},"metrics":{json.dumps(dict(process=processes, **columns))},'
+                         f'"meta":{json.dumps(self.meta)}}}', final=True)
+        self.file.write(REPORT_SCRIPT)
+        self.file.close()
+
+#--format names; text is the original .out and .html pair
+OUTPUT_FORMATS = ('text', 'jsonl', 'csv', 'report')
+
+def make_writer(input_file, formats, process_count, title, quantum, collapse_idle=False, cpus=1, shared=True, resume_offsets=None):
+    #One writer per format, combined with a TeeLog when there is more than one
+    if resume_offsets is not None and len(formats) == 1:
+        #A lone writer checkpoints its own offsets, not a TeeLog's tuple of them
+        resume_offsets = (resume_offsets,)
+    writers = []
+    for index, output_format in enumerate(formats):
+        offsets = None if resume_offsets is None else resume_offsets[index]
+        if output_format == 'text':
+            writers.append(OutputWriter(input_file, process_count, title, quantum, collapse_idle, cpus, shared, resume_offsets=offsets))
+        elif output_format == 'jsonl':
+            writers.append(JsonLinesWriter(input_file, resume_offsets=offsets))
+        elif output_format == 'csv':
+            writers.append(CsvWriter(input_file, resume_offsets=offsets))
+        elif output_format == 'report':
+            writers.append(HtmlReportWriter(input_file, process_count, title, quantum, cpus, shared, resume_offsets=offsets))
+        else:
+            raise ValueError(f"Unknown output format '{output_format}'")
+    return writers[0] if len(writers) == 1 else TeeLog(writers)
+
+class CheckpointPickler(pickle.Pickler):
+    #Processes are stored as their index in the schedule, the workload itself is read again on resume
+    def __init__(self, file, index):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.index = index
+
+    def persistent_id(self, obj):
+        if type(obj) is Process:
+            return self.index[id(obj)]
+        return None
+
+class CheckpointUnpickler(pickle.Unpickler):
+    def __init__(self, file, processes):
+        super().__init__(file)
+        self.processes = processes
+
+    def persistent_load(self, index):
+        if type(index) is not int or not 0 <= index < len(self.processes):
+            raise pickle.UnpicklingError(f"process index {index!r} is out of range")
+        return self.processes[index]
+
+    def find_class(self, module, name):
+        #Anything but the allowed globals is refused. Policies and queues are matched by class name, so they resolve to
+        #this file whether it runs as __main__ or is imported under another name
+        if (module, name) in CHECKPOINT_GLOBALS:
+            return super().find_class(module, name)
+        classes = {cls.__name__: cls for cls in (*POLICIES.values(), RunQueue, ShortestBurstQueue, IndexedHeap, MultiLevelQueue)}
+        if name not in classes:
+            raise pickle.UnpicklingError(f"unexpected class '{module}.{name}' in checkpoint")
+        return classes[name]
+
+class Checkpoint:
+    #Saves the simulation state every interval seconds so an interrupted run can be resumed with identical output
+    def __init__(self, file_name, fingerprint, interval):
+        self.file_name = file_name
+        self.fingerprint = fingerprint
+        self.interval = interval
+        self.countdown = CHECKPOINT_CHECK_EVERY
+        self.next_save = time.monotonic() + interval
+        self.index = None
+
+    def due(self):
+        #Called once per event; only reads the clock every CHECKPOINT_CHECK_EVERY calls
+        self.countdown -= 1
+        if self.countdown or not self.interval:
+            return False
+        self.countdown = CHECKPOINT_CHECK_EVERY
+        return time.monotonic() >= self.next_save
+
+    def save(self, schedule, policies, log, state):
+        #Per-process state goes in int64 columns (-1 for unset times), everything else is pickled
+        if self.index is None:
+            self.index = {id(process): index for index, process in enumerate(schedule.processes)}
+        processes = schedule.processes
+        #Checkpoints store the policies themselves, not the --profile instrumentation around them
+        policies = [policy.policy if isinstance(policy, ProfiledPolicy) else policy for policy in policies]
+        columns = (array('q', (process.remaining for process in processes)),
+                   array('q', (-1 if process.start_time is None else process.start_time for process in processes)),
+                   array('q', (-1 if process.end_time is None else process.end_time for process in processes)))
+        payload = {'version': CHECKPOINT_VERSION, 'fingerprint': self.fingerprint, 'cursor': schedule.cursor,
+                   'columns': columns, 'policies': policies, 'state': state, 'offsets': log.checkpoint()}
+        buffer = io.BytesIO()
+        CheckpointPickler(buffer, self.index).dump(payload)
+        #Written beside the old checkpoint and swapped in, so a kill mid-write leaves the previous one intact
+        with open(self.file_name + '.tmp', 'wb') as file:
+            file.write(zlib.compress(buffer.getbuffer(), 1))
+        os.replace(self.file_name + '.tmp', self.file_name)
+        self.next_save = time.monotonic() + self.interval
+
+    def load(self, schedule):
+        #Restores the schedule and processes in place; returns the policies, loop state and output offsets
+        with open(self.file_name, 'rb') as file:
+            data = file.read()
+        try:
+            payload = CheckpointUnpickler(io.BytesIO(zlib.decompress(data)), schedule.processes).load()
+        except (zlib.error, pickle.UnpicklingError, EOFError) as exc:
+            raise ValueError(f"'{self.file_name}' is not a valid checkpoint ({exc}), delete it to start over")
+        if not isinstance(payload, dict):
+            raise ValueError(f"'{self.file_name}' is not a valid checkpoint, delete it to start over")
+        if payload.get('version') != CHECKPOINT_VERSION or payload.get('fingerprint') != self.fingerprint:
+            raise ValueError(f"'{self.file_name}' was written for a different workload or version, delete it to start over")
+        schedule.cursor = payload['cursor']
+        remaining, start_times, end_times = payload['columns']
+        for process, left, start_time, end_time in zip(schedule.processes, remaining, start_times, end_times):
+            process.remaining = left
+            process.start_time = None if start_time < 0 else start_time
+            process.end_time = None if end_time < 0 else end_time
+        return payload['policies'], payload['state'], payload['offsets']
+
+    def remove(self):
+        if os.path.exists(self.file_name):
+            os.remove(self.file_name)
+
+def workload_fingerprint(input_file, run_for, algorithm, quantum, options, collapse_idle, formats):
+    #A checkpoint only resumes the exact input file and settings it was written for
+    stat = os.stat(input_file)
+    return (stat.st_size, stat.st_mtime_ns, run_for, algorithm, quantum, sorted(options.items()), collapse_idle, tuple(formats))
+
+#Files each --format writes next to the input, which is what a cache entry holds
+FORMAT_FILES = {'text': ('.out', '.html'), 'jsonl': ('.events.jsonl', '.metrics.json'),
+                'csv': ('.events.csv', '.metrics.csv'), 'report': ('.report.html',)}
+
+class ResultCache:
+    #Content-addressed store of finished runs: the key hashes the parsed workload, the output settings and the
+    #engine source, so the same workload under another file name (or as a binary file) is served from the cache
+    def __init__(self, directory, max_bytes=CACHE_DEFAULT_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.abspath(__file__), 'rb') as file:
+            self.engine_version = hashlib.sha256(file.read()).hexdigest()
+
+    def key(self, run_for, title, quantum, processes, options, collapse_idle, formats):
+        digest = hashlib.sha256(f'{CACHE_FORMAT_VERSION} {self.engine_version} {run_for} {title!r} {quantum} '
+                                f'{sorted(options.items())!r} {collapse_idle} {sorted(set(formats))!r}\n'.encode())
+        lines = []
+        for process in processes:
+            lines.append(f'{process.name!r} {process.arrival} {process.burst} {process.priority}\n')
+            if len(lines) == 65536:
+                digest.update(''.join(lines).encode())
+                lines = []
+        digest.update(''.join(lines).encode())
+        return digest.hexdigest()
+
+    def entry(self, key):
+        return os.path.join(self.directory, key)
+
+    def fetch(self, key, input_file, formats):
+        #Copies a stored run's files next to input_file and returns its metrics, or None on a miss
+        entry = self.entry(key)
+        try:
+            with open(os.path.join(entry, 'metrics.json')) as file:
+                metrics = Metrics.from_dict(json.load(file))
+            for extension in (extension for fmt in formats for extension in FORMAT_FILES[fmt]):
+                shutil.copyfile(os.path.join(entry, extension.lstrip('.')), output_path(input_file, extension))
+            #The entry's own time stamp is its last use for eviction
+            os.utime(entry)
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return metrics
+
+    def store(self, key, input_file, formats, metrics):
+        #Built in a private directory and renamed into place, so readers never see half an entry
+        entry = self.entry(key)
+        staging = f'{entry}.{os.getpid()}.tmp'
+        os.makedirs(staging, exist_ok=True)
+        try:
+            for extension in (extension for fmt in formats for extension in FORMAT_FILES[fmt]):
+                shutil.copyfile(output_path(input_file, extension), os.path.join(staging, extension.lstrip('.')))
+            with open(os.path.join(staging, 'metrics.json'), 'w') as file:
+                json.dump(metrics.to_dict(), file)
+            if self.entry_size(staging) > self.max_bytes:
+                return
+            os.rename(staging, entry)
+        except OSError:
+            #Another run stored the same key first
+            pass
+        finally:
+            if os.path.isdir(staging):
+                shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+
+    def entry_size(self, path):
+        return sum(item.stat().st_size for item in os.scandir(path))
+
+    def evict(self):
+        #Drops the least recently used entries until the cache fits in max_bytes
+        entries = []
+        for item in os.scandir(self.directory):
+            if item.is_dir() and not item.name.endswith('.tmp'):
+                entries.append((item.stat().st_mtime, self.entry_size(item.path), item.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            self.evictions += 1
+
+    def save_stats(self):
+        #Adds this run's counters to the running totals in stats.json and returns the totals
+        stats_file = os.path.join(self.directory, CACHE_STATS)
+        try:
+            with open(stats_file) as file:
+                stats = json.load(file)
+        except (OSError, ValueError):
+            stats = {}
+        for counter in ('hits', 'misses', 'evictions'):
+            stats[counter] = stats.get(counter, 0) + getattr(self, counter)
+        with open(f'{stats_file}.{os.getpid()}.tmp', 'w') as file:
+            json.dump(stats, file)
+        os.replace(f'{stats_file}.{os.getpid()}.tmp', stats_file)
+        return stats
+
+#Phases in report order; event_loop is whatever the simulation spends outside the other phases
+PROFILE_PHASES = ('parse', 'arrivals', 'policy', 'logging', 'event_loop', 'write_output')
+
+class Profile:
+    #Opt-in instrumentation for --profile. It is attached by wrapping the schedule, the policies and the
+    #output writer, so the simulation loops themselves carry no profiling code
+    def __init__(self):
+        self.phases = dict.fromkeys(PROFILE_PHASES, 0.0)
+        self.counts = dict.fromkeys(('arrivals', 'dispatches', 'preemptions', 'context_switches', 'log_events', 'idle_ticks'), 0)
+        #Run queue length at every arrival and dispatch decision, in power-of-two buckets keyed by their lower bound
+        self.queue_lengths = {}
+
+    def sample_queue(self, length):
+        bucket = 1 << (length.bit_length() - 1) if length else 0
+        self.queue_lengths[bucket] = self.queue_lengths.get(bucket, 0) + 1
+
+    def to_dict(self):
+        return {
+            'phases': self.phases,
+            'total': sum(self.phases.values()),
+            'counts': self.counts,
+            'queue_lengths': [{'min': bucket, 'max': max(bucket, 2 * bucket - 1), 'samples': self.queue_lengths[bucket]}
+                              for bucket in sorted(self.queue_lengths)],
+        }
+
+class ProfiledSchedule:
+    #Times arrival scanning; everything else goes straight to the schedule
+    def __init__(self, schedule, profile):
+        self.schedule = schedule
+        self.profile = profile
+
+    def __getattr__(self, name):
+        return getattr(self.schedule, name)
+
+    def pop_arrivals(self, current_time):
+        start = time.perf_counter()
+        arrivals = self.schedule.pop_arrivals(current_time)
+        self.profile.phases['arrivals'] += time.perf_counter() - start
+        return arrivals
+
+class ProfiledPolicy:
+    #Times every policy hook and counts the decisions it makes for one CPU
+    def __init__(self, policy, profile):
+        self.policy = policy
+        self.profile = profile
+        self.last_process = None
+
+    def __getattr__(self, name):
+        return getattr(self.policy, name)
+
+    def timed(self, phase, method, *args):
+        start = time.perf_counter()
+        result = method(*args)
+        self.profile.phases[phase] += time.perf_counter() - start
+        return result
+
+    def on_arrival(self, process, current_time):
+        self.profile.counts['arrivals'] += 1
+        self.profile.sample_queue(len(self.policy.queue))
+        self.timed('arrivals', self.policy.on_arrival, process, current_time)
+
+    def pick_next(self, current_time):
+        self.profile.sample_queue(len(self.policy.queue))
+        return self.timed('policy', self.policy.pick_next, current_time)
+
+    def steal_from(self, other, current_time):
+        self.profile.sample_queue(len(other.policy.queue))
+        return self.timed('policy', self.policy.steal_from, other.policy, current_time)
+
+    def on_dispatch(self, process, current_time):
+        #A context switch is a dispatch of a different process than the one this CPU ran last
+        self.profile.counts['dispatches'] += 1
+        if self.last_process is not None and process is not self.last_process:
+            self.profile.counts['context_switches'] += 1
+        self.last_process = process
+        self.timed('policy', self.policy.on_dispatch, process, current_time)
+
+    def should_preempt(self, running_process, current_time):
+        return self.timed('policy', self.policy.should_preempt, running_process, current_time)
+
+    def on_preempt(self, process, current_time):
+        self.profile.counts['preemptions'] += 1
+        self.timed('policy', self.policy.on_preempt, process, current_time)
+
+    def on_run(self, process, elapsed):
+        self.timed('policy', self.policy.on_run, process, elapsed)
+
+    def next_decision(self, running_process, current_time):
+        return self.timed('policy', self.policy.next_decision, running_process, current_time)
+
+    def preemption_rank(self, process, current_time):
+        return self.timed('policy', self.policy.preemption_rank, process, current_time)
+
+class ProfiledLog:
+    #Times event formatting and writing, and the final metrics output in close()
+    def __init__(self, log, profile):
+        self.log = log
+        self.profile = profile
+
+    def __getattr__(self, name):
+        return getattr(self.log, name)
+
+    def emit(self, event_time, kind, name, burst=None, cpu=None):
+        started = time.perf_counter()
+        self.log.emit(event_time, kind, name, burst, cpu)
+        self.profile.phases['logging'] += time.perf_counter() - started
+        self.profile.counts['log_events'] += 1
+
+    def idle(self, start, length):
+        started = time.perf_counter()
+        self.log.idle(start, length)
+        self.profile.phases['logging'] += time.perf_counter() - started
+        self.profile.counts['idle_ticks'] += length
+
+    def release(self, event_time, cpu):
+        started = time.perf_counter()
+        self.log.release(event_time, cpu)
+        self.profile.phases['logging'] += time.perf_counter() - started
+
+    def close(self, run_for, metrics, report=()):
+        start = time.perf_counter()
+        self.log.close(run_for, metrics, report)
+        self.profile.phases['write_output'] += time.perf_counter() - start
+
+def make_policy(algorithm, quantum, options=None):
+    #Resolves the 'use' directive against the policy registry
+    if algorithm not in POLICIES:
+        raise ValueError(f"Unknown algorithm '{algorithm}'")
+    policy_class = POLICIES[algorithm]
+    if policy_class.needs_quantum and quantum is None:
+        raise ValueError(f"Missing quantum parameter when use is '{algorithm}'")
+    return policy_class(quantum, options)
+
+def make_policies(algorithm, quantum, cpus=1, shared=True, options=None):
+    #One policy per CPU; in shared mode they all dispatch from the first one's queue
+    policies = [make_policy(algorithm, quantum, options) for _ in range(cpus)]
+    if shared:
+        for policy in policies[1:]:
+            policy.queue = policies[0].queue
+    return policies
+
+def simulate_file(input_file, collapse_idle=False, checkpoint_interval=0, resume=False, profile=None, formats=('text',), cache=None):
+    #Loads one workload, simulates it and writes the .out and .html (or the other formats) next to it. With checkpoint_interval
+    #the state is saved every that many seconds, and resume picks up from the last save if there is one.
+    #A Profile passed as profile is filled in with timings and counts for the run. With a ResultCache a workload
+    #that was simulated before is copied from the cache instead; profiled runs always simulate
+    start = time.perf_counter()
+    process_count, run_for, algorithm, quantum, processes, options = load_workload(input_file)
+    if profile is not None:
+        profile.phases['parse'] += time.perf_counter() - start
+    cpus = options.get('cpus', 1)
+    shared = options.get('queues', 'shared') == 'shared'
+    policies = make_policies(algorithm, quantum, cpus, shared, options)
+    if profile is not None:
+        cache = None
+    if cache is not None:
+        key = cache.key(run_for, policies[0].title, policies[0].quantum, processes, options, collapse_idle, formats)
+        metrics = cache.fetch(key, input_file, formats)
+        if metrics is not None:
+            return run_for, metrics
+    schedule = ArrivalSchedule(processes)
+
+    checkpoint = None
+    state = None
+    offsets = None
+    if checkpoint_interval or resume:
+        fingerprint = workload_fingerprint(input_file, run_for, algorithm, quantum, options, collapse_idle, formats)
+        checkpoint = Checkpoint(output_path(input_file, CHECKPOINT_EXTENSION), fingerprint, checkpoint_interval)
+        if resume and os.path.exists(checkpoint.file_name):
+            policies, state, offsets = checkpoint.load(schedule)
+
+    writer = make_writer(input_file, formats, schedule.process_count(), policies[0].title, policies[0].quantum, collapse_idle, cpus, shared,
+                         resume_offsets=offsets)
+    if profile is not None:
+        #Only the event_loop phase is measured here, as what is left once the wrapped phases are taken out
+        schedule = ProfiledSchedule(schedule, profile)
+        policies = [ProfiledPolicy(policy, profile) for policy in policies]
+        writer = ProfiledLog(writer, profile)
+        measured = sum(profile.phases[phase] for phase in ('arrivals', 'policy', 'logging'))
+        start = time.perf_counter()
+    metrics = run_policies(schedule, run_for, policies, shared, writer, checkpoint, state)
+    if profile is not None:
+        elapsed = time.perf_counter() - start
+        profile.phases['event_loop'] += elapsed - (sum(profile.phases[phase] for phase in ('arrivals', 'policy', 'logging')) - measured)
+    writer.close(run_for, metrics, policies[0].report(policies))
+    if checkpoint is not None:
+        checkpoint.remove()
+    if cache is not None:
+        cache.store(key, input_file, formats, metrics)
+    return run_for, metrics
+
+def run_policies(schedule, run_for, policies, shared, log, checkpoint=None, resume=None):
+    #A single CPU keeps the original loop and output, more CPUs go through simulate_smp
+    if len(policies) == 1:
+        return simulate(schedule, run_for, policies[0], log, checkpoint, resume)
+    return simulate_smp(schedule, run_for, policies, shared, log, checkpoint, resume)
+
+def timed_simulation(input_file, collapse_idle=False, formats=('text',), cache=None):
+    #Batch worker: returns the elapsed time, an error message instead of raising, and the cache counters of this file
+    start = time.perf_counter()
+    try:
+        simulate_file(input_file, collapse_idle, formats=formats, cache=cache)
+        error = None
+    except Exception as exc:
+        error = str(exc) or type(exc).__name__
+    counters = (cache.hits, cache.misses, cache.evictions) if cache is not None else (0, 0, 0)
+    return time.perf_counter() - start, error, counters
+
+def run_batch(pattern, jobs=None, collapse_idle=False, formats=('text',), cache=None):
+    #Simulates every matching .in file in parallel and prints a timing summary
+    if os.path.isdir(pattern):
+        input_files = sorted(glob.glob(os.path.join(pattern, '*.in')) + glob.glob(os.path.join(pattern, '*' + BINARY_EXTENSION)))
+    else:
+        input_files = sorted(glob.glob(pattern))
+    if not input_files:
+        print(f"Error: No .in files match '{pattern}'")
+        return 1
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(timed_simulation, input_files, [collapse_idle] * len(input_files), [formats] * len(input_files),
+                                    [cache] * len(input_files)))
+    wall_time = time.perf_counter() - start
+
+    width = max(len(input_file) for input_file in input_files)
+    failures = 0
+    for input_file, (elapsed, error, (hits, misses, evictions)) in zip(input_files, results):
+        if error:
+            failures += 1
+        status = 'ok' if error is None else 'Error: ' + error
+        if hits:
+            status += ' (cached)'
+        print(f"{input_file:<{width}}  {elapsed:>9.3f}s  {status}")
+        if cache is not None:
+            cache.hits += hits
+            cache.misses += misses
+            cache.evictions += evictions
+    print(f"{len(input_files)} files, {failures} failed, {sum(result[0] for result in results):.3f}s simulated in {wall_time:.3f}s wall")
+    if cache is not None:
+        print_cache_stats(cache)
+    return 1 if failures else 0
+
+class NullLog:
+    #Event sink that discards everything, for runs where only the metrics matter
+    def emit(self, time, kind, name, burst=None, cpu=None):
+        pass
+
+    def idle(self, start, length):
+        pass
+
+    def release(self, time, cpu):
+        pass
+
+#Set once per sweep worker; with fork it is inherited copy-on-write instead of pickled
+SWEEP_WORKLOAD = None
+
+def init_sweep_worker(workload):
+    global SWEEP_WORKLOAD
+    process_count, run_for, algorithm, quantum, processes, options = workload
+    SWEEP_WORKLOAD = (run_for, options, ArrivalSchedule(processes))
+
+def sweep_point(point):
+    algorithm, quantum = point
+    run_for, options, schedule = SWEEP_WORKLOAD
+    shared = options.get('queues', 'shared') == 'shared'
+    policies = make_policies(algorithm, quantum, options.get('cpus', 1), shared, options)
+    return run_policies(schedule, run_for, policies, shared, NullLog()).summary(run_for)
+
+def parse_quantums(values):
+    #Accepts single values and inclusive ranges such as 1-10 or 2-20:2
+    quantums = []
+    for value in values:
+        span, _, step = value.partition(':')
+        first, _, last = span.partition('-')
+        quantums.extend(range(int(first), int(last or first) + 1, int(step or 1)))
+    return quantums
+
+def run_sweep(input_file, algorithms, quantums, jobs=None):
+    #Simulates every policy/quantum combination on one parsed workload in parallel and prints a comparison table
+    workload = load_workload(input_file)
+    points = []
+    for algorithm in algorithms:
+        if algorithm not in POLICIES:
+            raise ValueError(f"Unknown algorithm '{algorithm}'")
+        if POLICIES[algorithm].needs_quantum:
+            #Without --quantums the workload's own quantum is used
+            if not quantums and workload[3] is None:
+                raise ValueError(f"--quantums is required to sweep '{algorithm}' when the workload has no quantum")
+            points.extend((algorithm, quantum) for quantum in quantums or [workload[3]])
+        else:
+            points.append((algorithm, None))
+
+    start = time.perf_counter()
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context, initializer=init_sweep_worker, initargs=(workload,)) as executor:
+        summaries = list(executor.map(sweep_point, points, chunksize=max(1, len(points) // (4 * (jobs or os.cpu_count() or 1)))))
+    wall_time = time.perf_counter() - start
+
+    width = max(len('policy'), *(len(algorithm) for algorithm in algorithms))
+    header = f"{'policy':<{width}} {'quantum':>7}"
+    for key in ('wait', 'turnaround', 'response'):
+        header += f" | {key + ' mean':>15} {'p95':>9} {'p99':>9}"
+    print(header)
+    for (algorithm, quantum), summary in zip(points, summaries):
+        row = f"{algorithm:<{width}} {'-' if quantum is None else quantum:>7}"
+        for key in ('wait', 'turnaround', 'response'):
+            stats = summary[key]
+            row += f" | {stats['mean']:>15.2f} {stats['p95']:>9.2f} {stats['p99']:>9.2f}"
+        print(row)
+    print(f"{len(points)} combinations in {wall_time:.3f}s wall")
+
+#--serve refuses request bodies larger than this
+SERVICE_MAX_BODY = 256 << 20
+
+def service_job(address, token, workload, overrides, with_events):
+    #Service worker: connects back to the service and streams NDJSON for one submission: a header line (or an
+    #error line), the events unless with_events is off, then the metrics
+    with socket.create_connection(address) as connection, \
+            connection.makefile('w', buffering=1 << 16, encoding='utf-8', newline='\n') as stream:
+        stream.write(token + '\n')
+        try:
+            process_count, run_for, algorithm, quantum, processes, options = parse_workload(io.BytesIO(workload))
+            algorithm = overrides.get('use', algorithm)
+            quantum = overrides.get('quantum', quantum)
+            cpus = options.get('cpus', 1)
+            shared = options.get('queues', 'shared') == 'shared'
+            policies = make_policies(algorithm, quantum, cpus, shared, options)
+        except ValueError as exc:
+            stream.write(json.dumps({'error': str(exc)}) + '\n')
+            return
+        schedule = ArrivalSchedule(processes)
+        stream.write(json.dumps({'processes': schedule.process_count(), 'title': policies[0].title, 'quantum': policies[0].quantum,
+                                 'cpus': cpus, 'run_for': run_for}) + '\n')
+        metrics = run_policies(schedule, run_for, policies, shared, JsonLinesLog(stream) if with_events else NullLog())
+        stream.write(json.dumps({'metrics': metrics.columns(), 'summary': metrics.summary(run_for),
+                                 'report': policies[0].report(policies)}) + '\n')
+
+class SimulationService:
+    #--serve: an asyncio HTTP front end over a pool of worker processes that keep the engine loaded. A worker
+    #streams its results back over a loopback connection, matched to the waiting request by a one-time token
+    def __init__(self, jobs=None):
+        self.workers = jobs or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.waiting = {}
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+
+    async def start(self, address):
+        #address is a port, host:port, or a path for a Unix socket
+        self.results = await asyncio.start_server(self.accept_results, '127.0.0.1', 0)
+        self.results_address = self.results.sockets[0].getsockname()[:2]
+        if not address.isdigit() and ':' not in address:
+            return await asyncio.start_unix_server(self.handle, path=address)
+        host, _, port = address.rpartition(':')
+        return await asyncio.start_server(self.handle, host or '127.0.0.1', int(port))
+
+    async def accept_results(self, reader, writer):
+        token = (await reader.readline()).decode().strip()
+        connected = self.waiting.pop(token, None)
+        if connected is None or connected.done():
+            writer.close()
+            return
+        connected.set_result((reader, writer))
+
+    async def handle(self, reader, writer):
+        try:
+            request = await self.read_request(reader, writer)
+            if request is None:
+                return
+            method, path, query, body = request
+            if path == '/simulate' and method == 'POST':
+                await self.simulate(writer, body, query)
+            elif path == '/health' and method == 'GET':
+                await self.respond(writer, 200, {'workers': self.workers, 'active': self.active,
+                                                 'completed': self.completed, 'failed': self.failed})
+            elif path == '/policies' and method == 'GET':
+                await self.respond(writer, 200, {name: {'needs_quantum': policy.needs_quantum} for name, policy in POLICIES.items()})
             else:
-                file.write(f"<tr><td>{entry[0]:>3}</td><td>{entry[1]}</td></tr>\n")  # Default color for idle
-        file.write("</table>\n")
+                await self.respond(writer, 404, {'error': f'No route for {method} {path}'})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader, writer):
+        #Just enough HTTP/1.1: a request line, headers and a Content-Length body; one request per connection
+        try:
+            method, target, _ = (await reader.readline()).decode('latin-1').split()
+        except ValueError:
+            await self.respond(writer, 400, {'error': 'Malformed request line'})
+            return None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        if 'transfer-encoding' in headers:
+            await self.respond(writer, 411, {'error': 'Send the workload with a Content-Length'})
+            return None
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            await self.respond(writer, 400, {'error': 'Content-Length must be a non-negative integer'})
+            return None
+        if length > SERVICE_MAX_BODY:
+            await self.respond(writer, 413, {'error': f'Workloads are limited to {SERVICE_MAX_BODY} bytes'})
+            return None
+        if length and headers.get('expect', '').lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        body = await reader.readexactly(length)
+        url = urllib.parse.urlsplit(target)
+        return method, url.path, dict(urllib.parse.parse_qsl(url.query)), body
+
+    async def respond(self, writer, status, payload):
+        body = (json.dumps(payload) + '\n').encode()
+        writer.write(f'HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\nContent-Type: application/json\r\n'
+                     f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+        await writer.drain()
+
+    async def simulate(self, writer, body, query):
+        #?use=POLICY and ?quantum=Q override the workload's own, ?events=0 sends only the header and the metrics
+        overrides = {}
+        if 'use' in query:
+            overrides['use'] = query['use']
+        if 'quantum' in query:
+            try:
+                overrides['quantum'] = int(query['quantum'])
+            except ValueError:
+                overrides['quantum'] = 0
+            if overrides['quantum'] < 1:
+                await self.respond(writer, 400, {'error': 'quantum must be a positive integer'})
+                return
+        with_events = query.get('events', '1') not in ('0', 'false', 'no')
+
+        loop = asyncio.get_running_loop()
+        token = secrets.token_hex(16)
+        connected = loop.create_future()
+        self.waiting[token] = connected
+        self.active += 1
+        job = loop.run_in_executor(self.executor, service_job, self.results_address, token, body, overrides, with_events)
+        results = None
+        try:
+            await asyncio.wait((connected, job), return_when=asyncio.FIRST_COMPLETED)
+            if not connected.done():
+                #A quick worker can finish before its connection is accepted, a failed one never connects
+                await job
+                await asyncio.wait_for(connected, 10)
+            reader, results = connected.result()
+            header = await reader.readline()
+            if b'"error"' in header[:10]:
+                self.failed += 1
+                writer.write(f'HTTP/1.1 400 Bad Request\r\nContent-Type: application/json\r\n'
+                             f'Content-Length: {len(header)}\r\nConnection: close\r\n\r\n'.encode() + header)
+                await writer.drain()
+                return
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n'
+                         b'Connection: close\r\n\r\n')
+            chunk = header
+            while chunk:
+                writer.write(b'%x\r\n%b\r\n' % (len(chunk), chunk))
+                await writer.drain()
+                chunk = await reader.read(1 << 16)
+            try:
+                await job
+                self.completed += 1
+            except Exception as exc:
+                self.failed += 1
+                line = (json.dumps({'error': str(exc) or type(exc).__name__}) + '\n').encode()
+                writer.write(b'%x\r\n%b\r\n' % (len(line), line))
+            writer.write(b'0\r\n\r\n')
+            await writer.drain()
+        except Exception as exc:
+            if isinstance(exc, ConnectionError):
+                raise
+            self.failed += 1
+            await self.respond(writer, 500, {'error': str(exc) or type(exc).__name__})
+        finally:
+            self.waiting.pop(token, None)
+            self.active -= 1
+            if results is not None:
+                results.close()
+            #A job abandoned by a client that went away still has its outcome collected
+            job.add_done_callback(lambda future: future.cancelled() or future.exception())
+
+async def serve(address, jobs=None):
+    service = SimulationService(jobs)
+    server = await service.start(address)
+    print(f"Serving on {address} with {service.workers} workers", flush=True)
+    async with server:
+        await server.serve_forever()
 
-        file.write(f"<p>Finished at time {run_for}</p>\n")
+def print_cache_stats(cache):
+    totals = cache.save_stats()
+    print(f"Cache: {cache.hits} hits, {cache.misses} misses, {cache.evictions} evicted "
+          f"({totals['hits']} hits and {totals['misses']} misses in total)")
 
-        file.write("<table border='1'>\n")
-        file.write("<tr><th>Process</th><th>Wait Time</th><th>Turnaround Time</th><th>Response Time</th></tr>\n")
-        for name, metric in sorted(metrics.items()):
-            file.write(f"<tr><td>{name}</td><td>{metric['wait']}</td><td>{metric['turnaround']}</td><td>{metric['response']}</td></tr>\n")
-        file.write("</table>\n")
+def print_summary(summary):
+    print(f"completed {summary['completed']} throughput {summary['throughput']:.4f} cpu utilization {summary['cpu_utilization']:.2%}")
+    for key in ('wait', 'turnaround', 'response'):
+        stats = summary[key]
+        print(f"{key:<10} mean {stats['mean']:>8.2f} p50 {stats['p50']:>8.2f} p95 {stats['p95']:>8.2f} p99 {stats['p99']:>8.2f} max {stats['max']:>6}")
 
-        file.write("</body></html>\n")
+def print_profile(profile):
+    total = sum(profile.phases.values())
+    for phase, seconds in profile.phases.items():
+        print(f"{phase:<12} {seconds:>10.4f}s {seconds / total if total else 0:>7.2%}")
+    print(" ".join(f"{key} {value}" for key, value in profile.counts.items()))
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: scheduler-gpt.py <input file>")
-        sys.exit(1)
-    
-    input_file = sys.argv[1]
-    process_count, run_for, algorithm, quantum, processes = parse_input(input_file)
-
-    if algorithm == 'fcfs':
-        log, metrics = fcfs(processes, run_for)
-    elif algorithm == 'sjf':
-        log, metrics = sjf(processes, run_for)
-    elif algorithm == 'rr':
-        if quantum is None:
-            print("Error: Missing quantum parameter when use is 'rr'")
+    parser = argparse.ArgumentParser(prog='scheduler-gpt.py')
+    parser.add_argument('input_file', nargs='?', help='workload .in file')
+    parser.add_argument('--batch', metavar='DIR_OR_GLOB', help='simulate every .in file in a directory or matching a glob in parallel')
+    parser.add_argument('--sweep', nargs='+', metavar='POLICY', help='compare these policies on the input file instead of writing output')
+    parser.add_argument('--quantums', nargs='+', metavar='Q', help="quantum values or ranges (1-10, 2-20:2) for --sweep (default: the workload's quantum)")
+    parser.add_argument('--serve', metavar='ADDRESS', help='run the simulation service on a port, host:port or Unix socket path')
+    parser.add_argument('--jobs', type=int, help='worker processes for --batch, --sweep and --serve (default: all cores)')
+    parser.add_argument('--convert', action='store_true', help='write the workload as a binary ' + BINARY_EXTENSION + ' file next to it instead of simulating')
+    parser.add_argument('--format', nargs='+', choices=OUTPUT_FORMATS, default=['text'], help='text (.out and .html), jsonl (.events.jsonl and .metrics.json), csv (.events.csv and .metrics.csv) and/or report (.report.html)')
+    parser.add_argument('--collapse-idle', action='store_true', help='show each idle stretch as one row in the .html file')
+    parser.add_argument('--summary', action='store_true', help='print mean/p50/p95/p99/max, throughput and CPU utilization')
+    parser.add_argument('--checkpoint', type=float, default=60, metavar='SECONDS', help='save the simulation state this often so it can be resumed (0 turns it off)')
+    parser.add_argument('--resume', action='store_true', help='continue from the last checkpoint of an interrupted run, if there is one')
+    parser.add_argument('--cache', metavar='DIR', help='reuse the output of identical workloads simulated before, stored in DIR')
+    parser.add_argument('--cache-size', type=int, default=CACHE_DEFAULT_SIZE >> 20, metavar='MB', help='evict least recently used cache entries beyond this size')
+    parser.add_argument('--profile', nargs='?', const='', metavar='JSON_FILE', help='time each phase and count events, written as JSON (default: next to the output)')
+    args = parser.parse_args()
+
+    cache = ResultCache(args.cache, args.cache_size << 20) if args.cache else None
+    if args.batch:
+        sys.exit(run_batch(args.batch, args.jobs, args.collapse_idle, args.format, cache))
+    if args.serve:
+        try:
+            asyncio.run(serve(args.serve, args.jobs))
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+    if args.input_file is None:
+        parser.error('an input file or --batch is required')
+
+    if args.sweep:
+        try:
+            run_sweep(args.input_file, args.sweep, parse_quantums(args.quantums or []), args.jobs)
+        except ValueError as exc:
+            print(f"Error: {exc}")
             sys.exit(1)
-        log, metrics = rr(processes, run_for, quantum)
-    else:
-        print(f"Error: Unknown algorithm '{algorithm}'")
+        sys.exit(0)
+
+    if args.convert:
+        try:
+            process_count, run_for, algorithm, quantum, processes, options = load_workload(args.input_file)
+        except ValueError as exc:
+            print(f"Error: {exc}")
+            sys.exit(1)
+        binary_file = os.path.splitext(args.input_file)[0] + BINARY_EXTENSION
+        write_binary_workload(binary_file, run_for, algorithm, quantum, processes, options)
+        print(f"Wrote {binary_file}")
+        sys.exit(0)
+
+    profile = Profile() if args.profile is not None else None
+    try:
+        run_for, metrics = simulate_file(args.input_file, args.collapse_idle, args.checkpoint, args.resume, profile, args.format, cache)
+    except ValueError as exc:
+        print(f"Error: {exc}")
         sys.exit(1)
+    if cache is not None:
+        print_cache_stats(cache)
+
+    if profile is not None:
+        profile_file = args.profile or output_path(args.input_file, '.profile.json')
+        with open(profile_file, 'w') as file:
+            json.dump(profile.to_dict(), file, indent=2)
+        print_profile(profile)
+        print(f"Profile written to {profile_file}")
 
-    write_output(input_file, log, metrics, algorithm, quantum, run_for)
\ No newline at end of file
+    if args.summary:
+        print_summary(metrics.summary(run_for))